@@ -1,6 +1,46 @@
+import asyncio
+import hashlib
+import json
+import time
 import discord
 from discord.ext import commands
-from utils.config import CMD_PREFIX, FFMPEG_PATH
+from utils import startup
+from utils.config import (
+    CMD_PREFIX, FFMPEG_PATH, METRICS_HOST, METRICS_PORT, FORCE_COMMAND_SYNC, COMMAND_RECORD_PATH, WARM_INTERVAL
+)
+from utils.metrics import Gauge, start_metrics_server
+from utils.watchdog import start_watchdog
+
+VOICE_CLIENTS = Gauge('voice_clients', 'Connected voice clients')
+
+
+def _command_tree_digest(bot):
+    payload = sorted(
+        (command.to_dict(bot.tree) for command in bot.tree.get_commands()),
+        key=lambda c: (c.get('type', 1), c['name'])
+    )
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+async def _sync_commands(bot):
+    """Sync slash commands only when their definitions changed since the last sync"""
+    from services.database import get_meta, set_meta
+
+    key = f"command_tree_hash:{bot.application_id}"
+    digest = _command_tree_digest(bot)
+    try:
+        unchanged = get_meta(key) == digest
+    except Exception:
+        unchanged = False
+    if unchanged and not FORCE_COMMAND_SYNC:
+        return False
+
+    await bot.tree.sync()
+    try:
+        set_meta(key, digest)
+    except Exception as e:
+        print(f"Error saving command tree hash: {e}")
+    return True
 
 
 def create_bot():
@@ -10,15 +50,42 @@ def create_bot():
 
     bot = commands.Bot(command_prefix=CMD_PREFIX, intents=intents)
     discord.FFmpegOpusAudio.ffmpeg_executable = FFMPEG_PATH
+    VOICE_CLIENTS.set_function(lambda: len(bot.voice_clients))
+    # Strong references to the background loops; the event loop only keeps weak ones
+    background_tasks = {}
+
+    async def setup_hook():
+        startup.mark('login')
+        start_watchdog()
+        if METRICS_PORT:
+            try:
+                await start_metrics_server(METRICS_HOST, METRICS_PORT)
+            except OSError as e:
+                print(f"❌ Could not start metrics server: {e}")
+        if WARM_INTERVAL:
+            from services.warmer import warm_loop
+            background_tasks['warmer'] = asyncio.create_task(warm_loop(bot))
+
+    bot.setup_hook = setup_hook
 
     @bot.event
     async def on_ready():
+        startup.mark('gateway')
         try:
-            await bot.tree.sync()
+            synced = await _sync_commands(bot)
+            startup.mark('command_sync', None if synced else 'unchanged, skipped')
             print(f'✅ Bot ready as {bot.user}')
         except Exception as e:
             print(f'❌ Error syncing slash commands: {e}')
 
+        from services.resume import resume_sessions, snapshot_loop
+        await resume_sessions(bot)
+        startup.mark('resume')
+        startup.report()
+        # Only after resuming, so the first save can't overwrite the snapshots being restored
+        if 'snapshots' not in background_tasks:
+            background_tasks['snapshots'] = asyncio.create_task(snapshot_loop(bot))
+
     @bot.event
     async def on_voice_state_update(member, before, after):
         """Cleanup when bot leaves voice channel"""
@@ -30,6 +97,37 @@ def create_bot():
                 print(
                     f"🧹 Cleaned up queue for guild {before.channel.guild.id}")
 
+    if COMMAND_RECORD_PATH:
+        from utils.recorder import record_command
+
+        # Time the command itself, not gateway delay or clock skew since the snowflake timestamp
+        async def mark_start(interaction):
+            interaction.extras['started'] = time.perf_counter()
+            return True
+
+        bot.tree.interaction_check = mark_start
+
+        @bot.before_invoke
+        async def mark_text_start(ctx):
+            ctx.started = time.perf_counter()
+
+        @bot.event
+        async def on_app_command_completion(interaction, command):
+            started = interaction.extras.get('started', time.perf_counter())
+            record_command(
+                command.qualified_name, 'slash', interaction.guild_id, interaction.user.id,
+                dict(interaction.namespace), interaction.created_at.timestamp(), time.perf_counter() - started
+            )
+
+        @bot.event
+        async def on_command_completion(ctx):
+            params = dict(zip(ctx.command.clean_params, ctx.args[1:]), **ctx.kwargs)
+            started = getattr(ctx, 'started', time.perf_counter())
+            record_command(
+                ctx.command.qualified_name, 'text', ctx.guild.id if ctx.guild else None, ctx.author.id,
+                params, ctx.message.created_at.timestamp(), time.perf_counter() - started
+            )
+
     from bot.commands import register_commands
     register_commands(bot)
 
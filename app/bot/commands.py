@@ -2,188 +2,372 @@ import discord
 import asyncio
 import os
 import random
+import time
 
 from services.music import (
-    add_to_queue, start_player, clear_queue, parse_time, seek_track,
+    add_to_queue, start_player, clear_queue, parse_time, seek_track, scheduler, is_active, _create_source,
     queues, current_tracks, cycle_loop_mode, pop_history,
-    skip_history_once, build_now_playing_embed, _format_duration
+    skip_history_once, build_now_playing_embed, _format_duration,
+    guild_memory, memory_report, extend_queue, set_now_playing_status, toggle_autoplay
+)
+from services.database import (
+    get_recent, get_top_tracks, get_most_active, log_event, get_user_status,
+    delete_snapshot, search_history, save_playlist, load_playlist, list_playlists
+)
+from services.track import Track
+from services.youtube import (
+    get_youtube_url, search_youtube, resolve_youtube_entry, refresh_url, video_id, watch_url,
+    playlist_id, get_youtube_playlist
+)
+from services.spotify import (
+    get_spotify_track, get_spotify_playlist, get_spotify_album, process_spotify_tracks, _resolve_track
 )
-from services.database import get_recent, get_top_tracks, get_most_active, log_event, get_user_status
-from services.youtube import get_youtube_url, search_youtube, resolve_youtube_entry
-from services.spotify import get_spotify_track, get_spotify_playlist, get_spotify_album, process_spotify_tracks
 from utils.audio import create_clip, download_audio, cleanup_temp_dir
-from utils.config import SPOTIFY_PATTERNS, MAX_QUEUE_DISPLAY, MAX_CLIP_LENGTH, MAX_FILE_SIZE
+from utils.watchdog import worst_offenders
+from utils.tracing import start_trace, span
+from utils.config import (
+    SPOTIFY_PATTERNS, MAX_QUEUE_DISPLAY, MAX_CLIP_LENGTH, MAX_FILE_SIZE, MAX_SAVED_PLAYLIST_TRACKS,
+    YOUTUBE_PLAYLIST_PAGE, MAX_YOUTUBE_PLAYLIST_TRACKS
+)
 
+NUMBER_EMOJIS = ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣']
+PICKER_TIMEOUT = 30
+FIRST_TRACK_CANDIDATES = 3
+
+
+class SearchPicker(discord.ui.View):
+    """One button per search result; the click is routed straight to the waiting /play"""
+
+    def __init__(self, user_id, results):
+        # The timeout is driven by the shared scheduler rather than a task per view
+        super().__init__(timeout=None)
+        self.user_id = user_id
+        self.results = results
+        self.choice = None
+        for i in range(len(results)):
+            button = discord.ui.Button(emoji=NUMBER_EMOJIS[i], style=discord.ButtonStyle.secondary)
+            button.callback = self._chooser(i)
+            self.add_item(button)
+
+    def _chooser(self, index):
+        async def choose(interaction: discord.Interaction):
+            self.choice = index
+            self.stop()
+            try:
+                await interaction.response.edit_message(
+                    content=f"🔍 Loading **{self.results[index]['title']}**...", embed=None, view=None
+                )
+            except Exception:
+                pass
+        return choose
 
-async def _get_first_valid_track(tracks):
-    for i, track in enumerate(tracks[:2]):
-        info = await get_youtube_url(track['search_query'])
-        if info:
-            return {
-                'url': info['url'],
-                'title': track['title'],
-                'webpage_url': info.get('webpage_url'),
-                'duration': track.get('duration') or info.get('duration'),
-                'thumbnail': track.get('thumbnail') or info.get('thumbnail'),
-            }, tracks[i+1:]
-    return None, []
+    async def interaction_check(self, interaction: discord.Interaction):
+        return interaction.user.id == self.user_id
 
 
-async def _handle_spotify_collection(tracks, guild_id, channel, user_id=0):
-    if not tracks:
-        return None, "❌ Empty or invalid collection"
+async def _get_first_valid_track(tracks, candidates=FIRST_TRACK_CANDIDATES):
+    """Resolve the first few tracks at once and return the earliest success in playlist order,
+    the tracks after it and the resolutions still in flight for them"""
+    pending = [asyncio.create_task(_resolve_track(t)) for t in tracks[:candidates]]
+    try:
+        for i, task in enumerate(pending):
+            song = await task
+            if song:
+                return song, tracks[i+1:], pending[i+1:]
+    except BaseException:
+        for task in pending:
+            task.cancel()
+        raise
+    return None, [], []
 
-    song, remaining = await _get_first_valid_track(tracks)
-    if not song:
-        return None, "❌ Cannot find tracks"
 
-    song['requested_by'] = user_id
+class _Followup:
+    """Background queueing a /play starts once its first track is playing, or cancels if the play fails"""
 
-    if remaining:
-        asyncio.create_task(process_spotify_tracks(
-            remaining, guild_id, channel, user_id))
+    def __init__(self, factory, pending=(), message=None):
+        self.factory = factory
+        self.pending = list(pending)
+        self.message = message
 
-    return song, f"✅ Found {len(tracks)} tracks"
+    def start(self):
+        asyncio.create_task(self.factory())
 
+    def cancel(self):
+        for task in self.pending:
+            task.cancel()
 
-def register_commands(bot):
-    @bot.tree.command(name="play", description="Play audio from URL or search")
-    @discord.app_commands.describe(query="URL or search term")
-    async def play(interaction: discord.Interaction, query: str):
-        await interaction.response.defer(ephemeral=True)
 
-        if not interaction.user.voice:
-            return await interaction.followup.send("❌ Join a voice channel first")
+def _abandon(resolving):
+    """Cancel a /play resolution, including background work it already set up"""
+    if not resolving.done():
+        resolving.cancel()
+    elif not resolving.cancelled() and not resolving.exception():
+        followup = resolving.result()[3]
+        if followup:
+            followup.cancel()
 
-        voice_channel = interaction.user.voice.channel
-        voice_client = interaction.guild.voice_client
 
-        if not voice_client:
-            try:
-                voice_client = await voice_channel.connect()
-            except Exception:
-                return await interaction.followup.send("❌ Connection error")
-        elif voice_client.channel != voice_channel:
-            try:
-                await voice_client.move_to(voice_channel)
-            except Exception:
-                return await interaction.followup.send("❌ Cannot move to your channel")
+async def _handle_spotify_collection(tracks, guild_id, channel, user_id=0):
+    """First playable track of a collection and a follow-up that queues the rest"""
+    if not tracks:
+        return None, "❌ Empty or invalid collection", None
 
-        guild_id = interaction.guild_id
-        await interaction.followup.send("🔍 Searching...")
-
-        song = None
-        for pattern_type, pattern in SPOTIFY_PATTERNS.items():
-            match = pattern.match(query)
-            if match:
-                item_id = match.group(1)
-
-                if pattern_type == 'track':
-                    track_info = await get_spotify_track(item_id)
-                    if not track_info:
-                        return await interaction.followup.send("❌ Failed to fetch track")
-
-                    youtube_info = await get_youtube_url(track_info['search_query'])
-                    if not youtube_info:
-                        return await interaction.followup.send("❌ Couldn't find track")
-
-                    song = {
-                        'url': youtube_info['url'],
-                        'title': track_info['title'],
-                        'webpage_url': youtube_info.get('webpage_url'),
-                        'duration': track_info.get('duration') or youtube_info.get('duration'),
-                        'thumbnail': track_info.get('thumbnail') or youtube_info.get('thumbnail'),
-                    }
-
-                elif pattern_type == 'playlist':
-                    tracks = await get_spotify_playlist(item_id)
-                    if not tracks:
-                        return await interaction.followup.send("❌ Failed to load playlist")
-                    song, msg = await _handle_spotify_collection(tracks, guild_id, interaction.channel, interaction.user.id)
-                    if not song:
-                        return await interaction.followup.send(msg)
-                    await interaction.followup.send(msg)
-
-                elif pattern_type == 'album':
-                    tracks = await get_spotify_album(item_id)
-                    if not tracks:
-                        return await interaction.followup.send("❌ Failed to load album")
-                    song, msg = await _handle_spotify_collection(tracks, guild_id, interaction.channel, interaction.user.id)
-                    if not song:
-                        return await interaction.followup.send(msg)
-                    await interaction.followup.send(msg)
+    song, remaining, pending = await _get_first_valid_track(tracks)
+    if not song:
+        return None, "❌ Cannot find tracks", None
 
-                break
+    song['requested_by'] = user_id
+    followup = _Followup(
+        lambda: process_spotify_tracks(remaining, guild_id, channel, user_id, pending),
+        pending, f"✅ Found {len(tracks)} tracks"
+    )
+    return song, None, followup
 
-        if not song:
-            is_url = query.startswith(('http://', 'https://'))
 
-            if is_url:
-                youtube_info = await get_youtube_url(query)
-                if not youtube_info:
-                    return await interaction.followup.send("❌ Nothing found")
-                song = youtube_info
-            else:
-                results = await search_youtube(query)
-                if not results:
-                    return await interaction.followup.send("❌ Nothing found")
+async def _connect_voice(interaction, voice_channel):
+    """Connect to or move into the caller's channel; returns (voice_client, error)"""
+    voice_client = interaction.guild.voice_client
+    if not voice_client:
+        try:
+            with span('voice.connect'):
+                return await voice_channel.connect(), None
+        except Exception:
+            return None, "❌ Connection error"
+    if voice_client.channel != voice_channel:
+        try:
+            with span('voice.move'):
+                await voice_client.move_to(voice_channel)
+        except Exception:
+            return None, "❌ Cannot move to your channel"
+    return voice_client, None
+
+
+async def _resolve_query(interaction, query):
+    """Turn a /play query into a playable song.
+
+    Returns (song, error, tracks to queue after it, _Followup or None). Nothing is
+    queued here, so a /play that fails to connect leaves the guild untouched.
+    """
+    guild_id = interaction.guild_id
+    song = None
+    extra = []
+    followup = None
+    for pattern_type, pattern in SPOTIFY_PATTERNS.items():
+        match = pattern.match(query)
+        if match:
+            item_id = match.group(1)
+
+            if pattern_type == 'track':
+                track_info = await get_spotify_track(item_id)
+                if not track_info:
+                    return None, "❌ Failed to fetch track", [], None
 
-                number_emojis = ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣']
-                lines = []
-                for i, r in enumerate(results):
-                    dur = _format_duration(r.get('duration')) or '?:??'
-                    channel = r.get('channel', '')
-                    line = f"{number_emojis[i]} **{r['title']}**\n{channel} — `{dur}`"
-                    lines.append(line)
-
-                embed = discord.Embed(
-                    title=f"🔍 Results for: {query[:50]}",
-                    description='\n\n'.join(lines),
-                    color=discord.Color.blue()
+                youtube_info = await get_youtube_url(
+                    track_info['search_query'], duration=track_info.get('duration')
                 )
-                embed.set_footer(text="React to choose a track (30s timeout)")
-
-                msg = await interaction.channel.send(embed=embed)
-                for i in range(len(results)):
-                    await msg.add_reaction(number_emojis[i])
+                if not youtube_info:
+                    return None, "❌ Couldn't find track", [], None
+
+                song = {
+                    'url': youtube_info['url'],
+                    'title': track_info['title'],
+                    'webpage_url': youtube_info.get('webpage_url'),
+                    'duration': track_info.get('duration') or youtube_info.get('duration'),
+                    'thumbnail': track_info.get('thumbnail') or youtube_info.get('thumbnail'),
+                }
+
+            elif pattern_type == 'playlist':
+                tracks = await get_spotify_playlist(item_id)
+                if not tracks:
+                    return None, "❌ Failed to load playlist", [], None
+                song, msg, followup = await _handle_spotify_collection(
+                    tracks, guild_id, interaction.channel, interaction.user.id)
+                if not song:
+                    return None, msg, [], None
+
+            elif pattern_type == 'album':
+                tracks = await get_spotify_album(item_id)
+                if not tracks:
+                    return None, "❌ Failed to load album", [], None
+                song, msg, followup = await _handle_spotify_collection(
+                    tracks, guild_id, interaction.channel, interaction.user.id)
+                if not song:
+                    return None, msg, [], None
+
+            break
 
-                def check(reaction, user):
-                    return (
-                        user == interaction.user
-                        and reaction.message.id == msg.id
-                        and str(reaction.emoji) in number_emojis[:len(results)]
-                    )
+    if not song:
+        is_url = query.startswith(('http://', 'https://'))
+
+        if is_url and playlist_id(query):
+            entries, listed = await get_youtube_playlist(query, YOUTUBE_PLAYLIST_PAGE)
+            if not entries:
+                return None, "❌ Failed to load playlist", [], None
+            song, extra = entries[0], entries[1:]
+            linked = video_id(query)
+            if linked:
+                # A watch?v=X&list=Y link plays X and continues with the playlist after it
+                index = next((i for i, e in enumerate(entries) if video_id(e['webpage_url']) == linked), None)
+                if index is not None:
+                    song, extra = entries[index], entries[index + 1:]
+                else:
+                    song = await get_youtube_url(watch_url(linked))
+                    if not song:
+                        return None, "❌ Nothing found", [], None
+                    extra = entries
+            if listed >= YOUTUBE_PLAYLIST_PAGE:
+                followup = _Followup(lambda: _queue_playlist_remainder(
+                    query, listed + 1, guild_id, interaction.channel, interaction.user.id))
+        elif is_url:
+            youtube_info = await get_youtube_url(query)
+            if not youtube_info:
+                return None, "❌ Nothing found", [], None
+            song = youtube_info
+        else:
+            with span('youtube.search', query=query[:100]):
+                results = await search_youtube(query)
+            if not results:
+                return None, "❌ Nothing found", [], None
+
+            results = results[:len(NUMBER_EMOJIS)]
+            lines = []
+            for i, r in enumerate(results):
+                dur = _format_duration(r.get('duration')) or '?:??'
+                channel = r.get('channel', '')
+                line = f"{NUMBER_EMOJIS[i]} **{r['title']}**\n{channel} — `{dur}`"
+                lines.append(line)
+
+            embed = discord.Embed(
+                title=f"🔍 Results for: {query[:50]}",
+                description='\n\n'.join(lines),
+                color=discord.Color.blue()
+            )
+            embed.set_footer(text=f"Pick a track ({PICKER_TIMEOUT}s timeout)")
 
-                try:
-                    reaction, _ = await bot.wait_for('reaction_add', timeout=30.0, check=check)
-                    choice = number_emojis.index(str(reaction.emoji))
-                except asyncio.TimeoutError:
-                    try:
-                        await msg.delete()
-                    except Exception:
-                        pass
-                    return await interaction.followup.send("⏱️ Selection timed out")
+            picker = SearchPicker(interaction.user.id, results)
+            with span('discord.picker'):
+                msg = await interaction.followup.send(embed=embed, view=picker, wait=True)
+            scheduler.arm(('picker', msg.id), PICKER_TIMEOUT, picker.stop)
+            await picker.wait()
+            scheduler.cancel(('picker', msg.id))
 
+            if picker.choice is None:
                 try:
-                    await msg.delete()
+                    await msg.edit(content="⏱️ Selection timed out", embed=None, view=None)
                 except Exception:
                     pass
+                return None, None, [], None
 
-                chosen = results[choice]
-                await interaction.followup.send(f"🔍 Loading **{chosen['title']}**...")
+            chosen = results[picker.choice]
+            youtube_info = await resolve_youtube_entry(chosen['webpage_url'])
+            if not youtube_info:
+                return None, "❌ Failed to load track", [], None
+            song = youtube_info
 
-                youtube_info = await resolve_youtube_entry(chosen['webpage_url'])
-                if not youtube_info:
-                    return await interaction.followup.send("❌ Failed to load track")
-                song = youtube_info
+    return song, None, extra, followup
+
+
+async def _queue_playlist_remainder(url, start, guild_id, channel, user_id):
+    """Queue the playlist entries from index start onwards, listed flat in the background"""
+    rest, _ = await get_youtube_playlist(url, MAX_YOUTUBE_PLAYLIST_TRACKS, background=True, start=start)
+    if not rest or not is_active(guild_id):
+        return
+    for track in rest:
+        track['requested_by'] = user_id
+    extend_queue(guild_id, rest)
+    await set_now_playing_status(guild_id, channel, f"✅ {len(rest)} more playlist tracks added to queue", final=True)
+
+
+def register_commands(bot):
+    @bot.tree.command(name="play", description="Play audio from URL or search")
+    @discord.app_commands.describe(query="URL or search term")
+    async def play(interaction: discord.Interaction, query: str):
+        requested_at = time.perf_counter()
+        trace_id = start_trace(getattr(interaction, 'id', None))
+        with span('discord.defer'):
+            await interaction.response.defer(ephemeral=True)
+
+        if not interaction.user.voice:
+            return await interaction.followup.send("❌ Join a voice channel first")
+
+        voice_channel = interaction.user.voice.channel
+        guild_id = interaction.guild_id
+        was_connected = interaction.guild.voice_client is not None
+
+        # Voice connect and resolution are the two slowest steps; run them side by side
+        connecting = asyncio.create_task(_connect_voice(interaction, voice_channel))
+        with span('discord.followup'):
+            await interaction.followup.send("🔍 Searching...")
+        resolving = asyncio.create_task(_resolve_query(interaction, query))
+
+        done, _ = await asyncio.wait({connecting, resolving}, return_when=asyncio.FIRST_COMPLETED)
+        if connecting in done and connecting.result()[1]:
+            _abandon(resolving)
+            return await interaction.followup.send(connecting.result()[1])
+
+        try:
+            song, error, extra, followup = await resolving
+        except Exception as e:
+            print(f"Error resolving {query[:100]}: {e}")
+            song, error, extra, followup = None, "❌ Nothing found", [], None
+        if not song:
+            voice_client, _ = await connecting
+            if voice_client and not was_connected and not is_active(guild_id):
+                await voice_client.disconnect()
+            if error:
+                await interaction.followup.send(error)
+            return
+
+        # Start ffmpeg on the stream while the voice handshake finishes
+        source = None
+        if not is_active(guild_id):
+            with span('player.prespawn_source'):
+                source = await _create_source(song)
+
+        voice_client, error = await connecting
+        if error:
+            if source:
+                source.cleanup()
+            if followup:
+                followup.cancel()
+            return await interaction.followup.send(error)
+        if followup and followup.message:
+            await interaction.followup.send(followup.message)
 
         song['requested_by'] = interaction.user.id
+        if trace_id:
+            song['trace_id'] = trace_id
 
         if voice_client.is_playing() or voice_client.is_paused():
+            if source:
+                source.cleanup()
             add_to_queue(guild_id, song)
             await interaction.followup.send(f"✅ Added to queue: **{song['title']}**")
         else:
-            await start_player(voice_client, song, guild_id, interaction.channel)
+            await start_player(
+                voice_client, song, guild_id, interaction.channel,
+                requested_at=requested_at, source=source
+            )
+
+        if extra:
+            for track in extra:
+                track['requested_by'] = interaction.user.id
+            extend_queue(guild_id, extra)
+            await interaction.followup.send(f"📋 Queued {len(extra)} more tracks from the playlist")
+        if followup:
+            followup.start()
+
+    @play.autocomplete('query')
+    async def play_query_autocomplete(interaction: discord.Interaction, current: str):
+        try:
+            rows = search_history(interaction.guild_id, current)
+        except Exception:
+            return []
+        return [
+            discord.app_commands.Choice(name=row['title'][:100], value=row['url'])
+            for row in rows
+            if len(row['url']) <= 100
+        ]
 
     @bot.tree.command(name="stop", description="Stop playback and clear queue")
     async def stop(interaction: discord.Interaction):
@@ -192,6 +376,10 @@ def register_commands(bot):
 
         if voice_client:
             clear_queue(interaction.guild_id)
+            try:
+                delete_snapshot(interaction.guild_id)
+            except Exception:
+                pass
             if voice_client.is_playing() or voice_client.is_paused():
                 voice_client.stop()
             await voice_client.disconnect()
@@ -284,6 +472,12 @@ def register_commands(bot):
         labels = {'off': '➡️ Loop off', 'track': '🔂 Looping track', 'queue': '🔁 Looping queue'}
         await interaction.followup.send(labels[mode])
 
+    @bot.tree.command(name="autoplay", description="Keep playing tracks often heard after the current one")
+    async def autoplay(interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+        enabled = toggle_autoplay(interaction.guild_id)
+        await interaction.followup.send("📻 Autoplay on" if enabled else "⏹️ Autoplay off")
+
     @bot.tree.command(name="previous", description="Go back to the previous track")
     async def previous(interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
@@ -445,10 +639,146 @@ def register_commands(bot):
 
         await interaction.followup.send(embed=embed)
 
+    @bot.tree.command(name="saveplaylist", description="Save the current track and queue as a server playlist")
+    @discord.app_commands.describe(name="Playlist name")
+    async def saveplaylist(interaction: discord.Interaction, name: str):
+        await interaction.response.defer(ephemeral=True)
+        guild_id = interaction.guild_id
+        name = name.strip()[:50]
+        if not name:
+            return await interaction.followup.send("❌ Give the playlist a name")
+
+        tracks = ([current_tracks[guild_id]] if guild_id in current_tracks else []) + queues.get(guild_id, [])
+        rows = []
+        for track in tracks[:MAX_SAVED_PLAYLIST_TRACKS]:
+            vid = video_id(track.get('webpage_url'))
+            if vid:
+                duration = track.get('duration')
+                rows.append((track['title'], vid, int(duration) if duration else None, track.get('thumbnail')))
+        if not rows:
+            return await interaction.followup.send("❌ Nothing to save")
+
+        try:
+            save_playlist(guild_id, name, interaction.user.id, rows)
+        except Exception as e:
+            print(f"Error saving playlist {name}: {e}")
+            return await interaction.followup.send("❌ Failed to save playlist")
+        await interaction.followup.send(f"💾 Saved **{name}** ({len(rows)} tracks)")
+
+    @bot.tree.command(name="loadplaylist", description="Queue a saved server playlist")
+    @discord.app_commands.describe(name="Playlist name")
+    async def loadplaylist(interaction: discord.Interaction, name: str):
+        requested_at = time.perf_counter()
+        await interaction.response.defer(ephemeral=True)
+        if not interaction.user.voice:
+            return await interaction.followup.send("❌ Join a voice channel first")
+
+        guild_id = interaction.guild_id
+        rows = load_playlist(guild_id, name.strip())
+        if not rows:
+            return await interaction.followup.send(f"❌ No saved playlist named **{name}**")
+
+        # Only video ids are stored; stream URLs are resolved as each track comes up
+        tracks = [
+            Track(
+                title=row['title'], webpage_url=watch_url(row['video_id']), duration=row['duration'],
+                thumbnail=row['thumbnail'], requested_by=interaction.user.id
+            )
+            for row in rows
+        ]
+
+        first = tracks[0]
+        connect = _connect_voice(interaction, interaction.user.voice.channel)
+        if is_active(guild_id):
+            (voice_client, error), url = await connect, None
+        else:
+            (voice_client, error), url = await asyncio.gather(connect, refresh_url(first['webpage_url']))
+        if error:
+            return await interaction.followup.send(error)
+        if url:
+            first['url'] = url
+
+        # A player between tracks is still active; queue everything behind it in order
+        if is_active(guild_id):
+            extend_queue(guild_id, tracks)
+            return await interaction.followup.send(f"📋 Queued {len(tracks)} tracks from **{name}**")
+
+        await start_player(voice_client, first, guild_id, interaction.channel, requested_at=requested_at)
+        extend_queue(guild_id, tracks[1:])
+        await interaction.followup.send(f"▶️ Playing **{name}** ({len(tracks)} tracks)")
+
+    @loadplaylist.autocomplete('name')
+    async def loadplaylist_autocomplete(interaction: discord.Interaction, current: str):
+        try:
+            rows = list_playlists(interaction.guild_id, current)
+        except Exception:
+            return []
+        return [
+            discord.app_commands.Choice(name=f"{row['name']} ({row['track_count']})", value=row['name'])
+            for row in rows
+        ]
+
+    @bot.tree.command(name="playlists", description="Show saved server playlists")
+    async def playlists(interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+        rows = list_playlists(interaction.guild_id)
+        if not rows:
+            return await interaction.followup.send("📋 No saved playlists")
+
+        embed = discord.Embed(title="💾 Saved Playlists", color=discord.Color.blue())
+        lines = [f"**{row['name']}** — {row['track_count']} tracks · <@{row['created_by']}>" for row in rows]
+        embed.description = "\n".join(lines)
+        await interaction.followup.send(embed=embed)
+
     @bot.tree.command(name="ping", description="Check bot latency")
     async def ping(interaction: discord.Interaction):
         await interaction.response.send_message(f"🏓 Pong! {round(bot.latency * 1000)}ms", ephemeral=True)
 
+    @bot.tree.command(name="lagreport", description="Show the calls that blocked the event loop the most")
+    @discord.app_commands.default_permissions(manage_guild=True)
+    async def lagreport(interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+        rows = worst_offenders()
+        if not rows:
+            return await interaction.followup.send("✅ No event loop stalls since startup")
+
+        embed = discord.Embed(title="🐢 Event Loop Stalls", color=discord.Color.orange())
+        for i, row in enumerate(rows, 1):
+            embed.add_field(
+                name=f"{i}. {row['site'][:100]}",
+                value=(
+                    f"**{row['count']}** stalls · {row['total'] * 1000:.0f}ms total · "
+                    f"{row['max'] * 1000:.0f}ms worst\n`{row['leaf'][:80]}`"
+                ),
+                inline=False
+            )
+        await interaction.followup.send(embed=embed)
+
+    @bot.tree.command(name="memory", description="Show memory used by queues and history")
+    @discord.app_commands.default_permissions(manage_guild=True)
+    async def memory(interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+        tracks, used = guild_memory(interaction.guild_id)
+        report = memory_report()
+
+        embed = discord.Embed(title="🧠 Track Memory", color=discord.Color.blue())
+        embed.add_field(name="This server", value=f"{tracks} tracks · {used / 1024:.1f} KB", inline=False)
+        embed.add_field(
+            name="All servers",
+            value=(
+                f"{report['tracks']} tracks in {report['guilds']} servers · {report['bytes'] / 1024:.1f} KB\n"
+                f"{report['stream_urls']} shared stream URLs · {report['stream_url_bytes'] / 1024:.1f} KB"
+            ),
+            inline=False
+        )
+        if report['largest']:
+            embed.add_field(
+                name="Largest",
+                value="\n".join(f"`{gid}` {n} tracks · {b / 1024:.1f} KB" for gid, (n, b) in report['largest']),
+                inline=False
+            )
+        await interaction.followup.send(embed=embed)
+
     @bot.tree.command(name="cut", description="Cut a section of current song")
     @discord.app_commands.describe(start="Start time (seconds or mm:ss)", end="End time (seconds or mm:ss)")
     async def cut(interaction: discord.Interaction, start: str, end: str):
@@ -519,7 +849,9 @@ def register_commands(bot):
                 if not track_info:
                     return await interaction.followup.send("❌ Failed to fetch track")
 
-                youtube_info = await get_youtube_url(track_info['search_query'])
+                youtube_info = await get_youtube_url(
+                    track_info['search_query'], duration=track_info.get('duration')
+                )
 
                 if not youtube_info:
                     return await interaction.followup.send("❌ Couldn't find track")
@@ -569,13 +901,13 @@ def register_commands(bot):
             def __init__(self, channel):
                 self.channel = channel
 
-            async def send(self, content=None, file=None, embed=None):
+            async def send(self, content=None, file=None, embed=None, view=None, wait=False):
                 if file:
-                    await self.channel.send(content, file=file)
-                elif embed:
-                    await self.channel.send(embed=embed)
+                    return await self.channel.send(content, file=file)
+                elif embed or view:
+                    return await self.channel.send(content, embed=embed, view=view)
                 else:
-                    await self.channel.send(content)
+                    return await self.channel.send(content)
 
         @property
         def followup(self):
@@ -621,6 +953,10 @@ def register_commands(bot):
     async def loop_text(ctx):
         await loop(TextInteraction(ctx))
 
+    @bot.command(name="autoplay")
+    async def autoplay_text(ctx):
+        await autoplay(TextInteraction(ctx))
+
     @bot.command(name="previous")
     async def previous_text(ctx):
         await previous(TextInteraction(ctx))
@@ -652,3 +988,15 @@ def register_commands(bot):
     @bot.command(name="status")
     async def status_text(ctx, user: discord.User = None):
         await status(TextInteraction(ctx), user)
+
+    @bot.command(name="saveplaylist")
+    async def saveplaylist_text(ctx, *, name: str):
+        await saveplaylist(TextInteraction(ctx), name)
+
+    @bot.command(name="loadplaylist")
+    async def loadplaylist_text(ctx, *, name: str):
+        await loadplaylist(TextInteraction(ctx), name)
+
+    @bot.command(name="playlists")
+    async def playlists_text(ctx):
+        await playlists(TextInteraction(ctx))
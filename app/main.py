@@ -1,6 +1,9 @@
+from utils import startup
 from os import getenv
 from bot.client import create_bot
 
+startup.mark('imports')
+
 
 if __name__ == "__main__":
     token = getenv("DISCORD__TOKEN")
@@ -9,5 +12,6 @@ if __name__ == "__main__":
         exit(1)
 
     bot = create_bot()
+    startup.mark('create_bot')
     print("Starting bot...")
     bot.run(token)
@@ -1,10 +1,17 @@
 import sqlite3
+import json
 import os
+import re
 from datetime import datetime, timedelta
+from utils.metrics import Histogram
 
 DB_PATH = os.getenv("DB_PATH", "/app/data/history.db")
 
 _conn = None
+_last_played = {}
+COPLAY_WINDOW_MINUTES = 30
+
+DB_WRITE_SECONDS = Histogram('db_write_seconds', 'Time spent writing to the history database')
 
 
 def _get_conn():
@@ -47,39 +54,420 @@ def _init_tables():
         CREATE INDEX IF NOT EXISTS idx_user_events_guild_user
         ON user_events (guild_id, user_id, created_at DESC)
     """)
+    _conn.execute("""
+        CREATE TABLE IF NOT EXISTS playback_snapshots (
+            guild_id INTEGER PRIMARY KEY,
+            voice_channel_id INTEGER NOT NULL,
+            text_channel_id INTEGER,
+            current_track TEXT,
+            position REAL NOT NULL DEFAULT 0,
+            queue TEXT NOT NULL,
+            loop_mode TEXT NOT NULL DEFAULT 'off',
+            saved_at TEXT NOT NULL
+        )
+    """)
+    _conn.execute("""
+        CREATE TABLE IF NOT EXISTS bot_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+    _conn.execute("""
+        CREATE TABLE IF NOT EXISTS saved_playlists (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            name TEXT NOT NULL COLLATE NOCASE,
+            created_by INTEGER NOT NULL,
+            track_count INTEGER NOT NULL,
+            saved_at TEXT NOT NULL,
+            UNIQUE (guild_id, name)
+        )
+    """)
+    _conn.execute("""
+        CREATE TABLE IF NOT EXISTS saved_playlist_tracks (
+            playlist_id INTEGER NOT NULL REFERENCES saved_playlists (id),
+            position INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            video_id TEXT NOT NULL,
+            duration INTEGER,
+            thumbnail TEXT,
+            PRIMARY KEY (playlist_id, position)
+        ) WITHOUT ROWID
+    """)
+    _conn.execute("""
+        CREATE TABLE IF NOT EXISTS failed_lookups (
+            lookup TEXT PRIMARY KEY,
+            reason TEXT NOT NULL,
+            failures INTEGER NOT NULL,
+            retry_at TEXT NOT NULL
+        ) WITHOUT ROWID
+    """)
+    _conn.execute("""
+        CREATE TABLE IF NOT EXISTS resolve_cache (
+            lookup TEXT PRIMARY KEY,
+            webpage_url TEXT NOT NULL,
+            resolved_at TEXT NOT NULL
+        ) WITHOUT ROWID
+    """)
+    _init_track_index()
+    _init_coplay()
     _conn.commit()
 
 
-def log_play(guild_id, user_id, track_title, track_url=None):
+def _init_track_index():
+    """Full-text index of played titles per guild, kept in sync by triggers"""
+    _conn.execute("""
+        CREATE TABLE IF NOT EXISTS track_index (
+            id INTEGER PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            url TEXT NOT NULL,
+            plays INTEGER NOT NULL DEFAULT 0,
+            last_played TEXT,
+            UNIQUE (guild_id, url)
+        )
+    """)
+    _conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_track_index_plays
+        ON track_index (guild_id, plays DESC)
+    """)
+    _conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS track_index_fts USING fts5(
+            title, content='track_index', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """)
+    _conn.executescript("""
+        CREATE TRIGGER IF NOT EXISTS track_index_ai AFTER INSERT ON track_index BEGIN
+            INSERT INTO track_index_fts (rowid, title) VALUES (new.id, new.title);
+        END;
+        CREATE TRIGGER IF NOT EXISTS track_index_ad AFTER DELETE ON track_index BEGIN
+            INSERT INTO track_index_fts (track_index_fts, rowid, title) VALUES ('delete', old.id, old.title);
+        END;
+        CREATE TRIGGER IF NOT EXISTS track_index_au AFTER UPDATE OF title ON track_index BEGIN
+            INSERT INTO track_index_fts (track_index_fts, rowid, title) VALUES ('delete', old.id, old.title);
+            INSERT INTO track_index_fts (rowid, title) VALUES (new.id, new.title);
+        END;
+    """)
+
+    if _conn.execute("SELECT 1 FROM track_index LIMIT 1").fetchone() is None:
+        _conn.execute("""
+            INSERT INTO track_index (guild_id, title, url, plays, last_played)
+            SELECT guild_id, MAX(track_title), track_url, COUNT(*), MAX(played_at)
+            FROM play_history
+            WHERE track_url IS NOT NULL
+            GROUP BY guild_id, track_url
+        """)
+
+
+def _init_coplay():
+    """Counts of which track followed which, per guild and globally (guild_id 0), for autoplay"""
+    _conn.execute("""
+        CREATE TABLE IF NOT EXISTS coplay (
+            guild_id INTEGER NOT NULL,
+            prev_url TEXT NOT NULL,
+            next_url TEXT NOT NULL,
+            next_title TEXT NOT NULL,
+            plays INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, prev_url, next_url)
+        ) WITHOUT ROWID
+    """)
+    _conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_coplay_rank
+        ON coplay (guild_id, prev_url, plays DESC)
+    """)
+
+    if _conn.execute("SELECT 1 FROM coplay LIMIT 1").fetchone() is None:
+        _conn.execute("""
+            WITH pairs AS (
+                SELECT guild_id, track_url AS next_url, track_title AS next_title, played_at,
+                       LAG(track_url) OVER w AS prev_url, LAG(played_at) OVER w AS prev_at
+                FROM play_history
+                WHERE track_url IS NOT NULL
+                WINDOW w AS (PARTITION BY guild_id ORDER BY id)
+            )
+            INSERT INTO coplay (guild_id, prev_url, next_url, next_title, plays)
+            SELECT g, prev_url, next_url, MAX(next_title), COUNT(*)
+            FROM (
+                SELECT guild_id AS g, * FROM pairs
+                UNION ALL
+                SELECT 0 AS g, * FROM pairs
+            )
+            WHERE prev_url IS NOT NULL AND prev_url != next_url
+              AND julianday(played_at) - julianday(prev_at) <= ? / 1440.0
+            GROUP BY g, prev_url, next_url
+        """, (COPLAY_WINDOW_MINUTES,))
+
+
+def _record_coplay(conn, guild_id, track_title, track_url, now, reinforce=True):
+    previous = _last_played.get(guild_id)
+    if previous is None:
+        row = conn.execute(
+            "SELECT track_url, played_at FROM play_history WHERE guild_id = ? ORDER BY played_at DESC LIMIT 1",
+            (guild_id,)
+        ).fetchone()
+        previous = (row['track_url'], datetime.fromisoformat(row['played_at'])) if row else (None, None)
+    _last_played[guild_id] = (track_url, now)
+
+    prev_url, prev_at = previous
+    if not reinforce or not prev_url or prev_url == track_url or now - prev_at > timedelta(minutes=COPLAY_WINDOW_MINUTES):
+        return
+    conn.executemany("""
+        INSERT INTO coplay (guild_id, prev_url, next_url, next_title, plays) VALUES (?, ?, ?, ?, 1)
+        ON CONFLICT (guild_id, prev_url, next_url) DO UPDATE SET
+            plays = plays + 1,
+            next_title = excluded.next_title
+    """, [(gid, prev_url, track_url, track_title) for gid in (guild_id, 0)])
+
+
+def log_play(guild_id, user_id, track_title, track_url=None, autoplay=False):
+    """Record a play; autoplay picks don't strengthen the coplay edge they were chosen from"""
     conn = _get_conn()
-    conn.execute(
-        "INSERT INTO play_history (guild_id, user_id, track_title, track_url, played_at) VALUES (?, ?, ?, ?, ?)",
-        (guild_id, user_id, track_title, track_url, datetime.utcnow().isoformat())
-    )
-    conn.commit()
+    played_at = datetime.utcnow()
+    now = played_at.isoformat()
+    with DB_WRITE_SECONDS.time(op='log_play'):
+        if track_url:
+            _record_coplay(conn, guild_id, track_title, track_url, played_at, reinforce=not autoplay)
+        conn.execute(
+            "INSERT INTO play_history (guild_id, user_id, track_title, track_url, played_at) VALUES (?, ?, ?, ?, ?)",
+            (guild_id, user_id, track_title, track_url, now)
+        )
+        if track_url:
+            conn.execute("""
+                INSERT INTO track_index (guild_id, title, url, plays, last_played) VALUES (?, ?, ?, 1, ?)
+                ON CONFLICT (guild_id, url) DO UPDATE SET
+                    plays = plays + 1,
+                    last_played = excluded.last_played,
+                    title = excluded.title
+            """, (guild_id, track_title, track_url, now))
+        conn.commit()
 
 
 def log_event(guild_id, user_id, event_type, track_title=None):
+    conn = _get_conn()
+    with DB_WRITE_SECONDS.time(op='log_event'):
+        conn.execute(
+            "INSERT INTO user_events (guild_id, user_id, event_type, track_title, created_at) VALUES (?, ?, ?, ?, ?)",
+            (guild_id, user_id, event_type, track_title, datetime.utcnow().isoformat())
+        )
+        conn.commit()
+
+
+def get_meta(key):
+    conn = _get_conn()
+    row = conn.execute("SELECT value FROM bot_meta WHERE key = ?", (key,)).fetchone()
+    return row['value'] if row else None
+
+
+def set_meta(key, value):
     conn = _get_conn()
     conn.execute(
-        "INSERT INTO user_events (guild_id, user_id, event_type, track_title, created_at) VALUES (?, ?, ?, ?, ?)",
-        (guild_id, user_id, event_type, track_title, datetime.utcnow().isoformat())
+        "INSERT INTO bot_meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+        (key, value)
     )
     conn.commit()
 
 
+def save_snapshots(snapshots):
+    """Replace all stored playback snapshots in a single transaction"""
+    conn = _get_conn()
+    now = datetime.utcnow().isoformat()
+    with DB_WRITE_SECONDS.time(op='save_snapshots'), conn:
+        conn.execute("DELETE FROM playback_snapshots")
+        conn.executemany(
+            "INSERT INTO playback_snapshots (guild_id, voice_channel_id, text_channel_id, current_track, position, queue, loop_mode, saved_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    s['guild_id'], s['voice_channel_id'], s.get('text_channel_id'),
+                    json.dumps(s['current_track']) if s.get('current_track') else None,
+                    s.get('position', 0), json.dumps(s.get('queue', [])),
+                    s.get('loop_mode', 'off'), now
+                )
+                for s in snapshots
+            ]
+        )
+
+
+def load_snapshots():
+    conn = _get_conn()
+    rows = conn.execute("SELECT * FROM playback_snapshots").fetchall()
+    return [
+        {
+            'guild_id': row['guild_id'],
+            'voice_channel_id': row['voice_channel_id'],
+            'text_channel_id': row['text_channel_id'],
+            'current_track': json.loads(row['current_track']) if row['current_track'] else None,
+            'position': row['position'],
+            'queue': json.loads(row['queue']),
+            'loop_mode': row['loop_mode'],
+            'saved_at': row['saved_at'],
+        }
+        for row in rows
+    ]
+
+
+def delete_snapshot(guild_id):
+    conn = _get_conn()
+    with DB_WRITE_SECONDS.time(op='delete_snapshot'):
+        conn.execute("DELETE FROM playback_snapshots WHERE guild_id = ?", (guild_id,))
+        conn.commit()
+
+
+def save_playlist(guild_id, name, user_id, tracks):
+    """Store (title, video_id, duration, thumbnail) rows under name, replacing any playlist of that name"""
+    conn = _get_conn()
+    now = datetime.utcnow().isoformat()
+    with DB_WRITE_SECONDS.time(op='save_playlist'), conn:
+        playlist_id = conn.execute("""
+            INSERT INTO saved_playlists (guild_id, name, created_by, track_count, saved_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (guild_id, name) DO UPDATE SET
+                created_by = excluded.created_by,
+                track_count = excluded.track_count,
+                saved_at = excluded.saved_at
+            RETURNING id
+        """, (guild_id, name, user_id, len(tracks), now)).fetchone()[0]
+        conn.execute("DELETE FROM saved_playlist_tracks WHERE playlist_id = ?", (playlist_id,))
+        conn.executemany(
+            "INSERT INTO saved_playlist_tracks (playlist_id, position, title, video_id, duration, thumbnail) VALUES (?, ?, ?, ?, ?, ?)",
+            [(playlist_id, i, *track) for i, track in enumerate(tracks)]
+        )
+
+
+def load_playlist(guild_id, name):
+    conn = _get_conn()
+    return conn.execute("""
+        SELECT t.title, t.video_id, t.duration, t.thumbnail
+        FROM saved_playlist_tracks t
+        JOIN saved_playlists p ON p.id = t.playlist_id
+        WHERE p.guild_id = ? AND p.name = ?
+        ORDER BY t.position
+    """, (guild_id, name)).fetchall()
+
+
+def get_resolved_lookup(key, max_age_days=30):
+    """Video a search query last resolved to, if that was recent enough to trust"""
+    conn = _get_conn()
+    cutoff = (datetime.utcnow() - timedelta(days=max_age_days)).isoformat()
+    row = conn.execute(
+        "SELECT webpage_url FROM resolve_cache WHERE lookup = ? AND resolved_at > ?", (key, cutoff)
+    ).fetchone()
+    return row['webpage_url'] if row else None
+
+
+def set_resolved_lookup(key, webpage_url):
+    conn = _get_conn()
+    with DB_WRITE_SECONDS.time(op='set_resolved_lookup'), conn:
+        conn.execute("""
+            INSERT INTO resolve_cache (lookup, webpage_url, resolved_at) VALUES (?, ?, ?)
+            ON CONFLICT (lookup) DO UPDATE SET
+                webpage_url = excluded.webpage_url,
+                resolved_at = excluded.resolved_at
+        """, (key, webpage_url, datetime.utcnow().isoformat()))
+
+
+def get_failed_lookup(key):
+    """(reason, retry due) for a lookup that failed before, or None"""
+    conn = _get_conn()
+    row = conn.execute("SELECT reason, retry_at FROM failed_lookups WHERE lookup = ?", (key,)).fetchone()
+    if not row:
+        return None
+    return row['reason'], row['retry_at'] <= datetime.utcnow().isoformat()
+
+
+def record_failed_lookup(key, reason, base_ttl, max_ttl):
+    """Remember a failed lookup; the retry delay doubles with each consecutive failure"""
+    conn = _get_conn()
+    with DB_WRITE_SECONDS.time(op='record_failed_lookup'), conn:
+        row = conn.execute("SELECT failures FROM failed_lookups WHERE lookup = ?", (key,)).fetchone()
+        failures = (row['failures'] if row else 0) + 1
+        ttl = min(max_ttl, base_ttl * 2 ** (failures - 1))
+        retry_at = (datetime.utcnow() + timedelta(seconds=ttl)).isoformat()
+        conn.execute("""
+            INSERT INTO failed_lookups (lookup, reason, failures, retry_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (lookup) DO UPDATE SET
+                reason = excluded.reason,
+                failures = excluded.failures,
+                retry_at = excluded.retry_at
+        """, (key, reason[:200], failures, retry_at))
+    return ttl
+
+
+def clear_failed_lookup(key):
+    conn = _get_conn()
+    with DB_WRITE_SECONDS.time(op='clear_failed_lookup'), conn:
+        return conn.execute("DELETE FROM failed_lookups WHERE lookup = ?", (key,)).rowcount > 0
+
+
+def get_coplay_candidates(guild_id, track_url, limit=5):
+    """Tracks most often played after track_url in this guild, then across all guilds"""
+    conn = _get_conn()
+    rows = []
+    for scope in (guild_id, 0):
+        rows += conn.execute(
+            "SELECT next_url, next_title, plays FROM coplay WHERE guild_id = ? AND prev_url = ? ORDER BY plays DESC LIMIT ?",
+            (scope, track_url, limit)
+        ).fetchall()
+    return rows
+
+
+def list_playlists(guild_id, prefix='', limit=25):
+    """Saved playlists whose name starts with prefix, case-insensitively, in name order"""
+    conn = _get_conn()
+    prefix = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return conn.execute(
+        "SELECT name, track_count, created_by, saved_at FROM saved_playlists "
+        "WHERE guild_id = ? AND name LIKE ? || '%' ESCAPE '\\' ORDER BY name LIMIT ?",
+        (guild_id, prefix, limit)
+    ).fetchall()
+
+
+def _fts_query(text):
+    tokens = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{token}"*' for token in tokens[:8])
+
+
+def search_history(guild_id, text, limit=25):
+    """Previously played tracks in this guild whose titles match the typed prefix"""
+    conn = _get_conn()
+    query = _fts_query(text)
+    if not query:
+        return conn.execute(
+            "SELECT title, url FROM track_index WHERE guild_id = ? ORDER BY plays DESC, last_played DESC LIMIT ?",
+            (guild_id, limit)
+        ).fetchall()
+    return conn.execute("""
+        SELECT t.title, t.url
+        FROM track_index_fts f
+        JOIN track_index t ON t.id = f.rowid
+        WHERE track_index_fts MATCH ? AND t.guild_id = ?
+        ORDER BY t.plays DESC, f.rank
+        LIMIT ?
+    """, (query, guild_id, limit)).fetchall()
+
+
 def get_recent(guild_id, limit=15):
     conn = _get_conn()
     return conn.execute(
-        "SELECT track_title, user_id, played_at FROM play_history WHERE guild_id = ? ORDER BY played_at DESC LIMIT ?",
+        "SELECT track_title, track_url, user_id, played_at FROM play_history WHERE guild_id = ? ORDER BY played_at DESC LIMIT ?",
         (guild_id, limit)
     ).fetchall()
 
 
+def get_active_guilds(hours, limit):
+    """Guilds with a play in the last `hours`, most recently active first"""
+    conn = _get_conn()
+    cutoff = (datetime.utcnow() - timedelta(hours=hours)).isoformat()
+    return [row['guild_id'] for row in conn.execute(
+        "SELECT guild_id, MAX(played_at) AS last_played FROM play_history GROUP BY guild_id "
+        "HAVING last_played > ? ORDER BY last_played DESC LIMIT ?",
+        (cutoff, limit)
+    )]
+
+
 def get_top_tracks(guild_id, limit=10):
     conn = _get_conn()
     return conn.execute(
-        "SELECT track_title, COUNT(*) as plays FROM play_history WHERE guild_id = ? GROUP BY track_title ORDER BY plays DESC LIMIT ?",
+        "SELECT track_title, MAX(track_url) as track_url, COUNT(*) as plays FROM play_history WHERE guild_id = ? GROUP BY track_title ORDER BY plays DESC LIMIT ?",
         (guild_id, limit)
     ).fetchall()
 
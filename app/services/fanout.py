@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import deque
+import discord
+from utils.metrics import Gauge
+
+FRAME_SECONDS = 0.02
+BUFFER_FRAMES = 500  # 10s of Opus frames kept for subscribers that start late or stall
+LIVE_DELAY_FRAMES = 5  # late joiners start this far behind the head to absorb jitter
+STALL_TIMEOUT = 10
+
+# {key: _Decoder}, one per stream currently being decoded for fan-out
+_decoders = {}
+_lock = threading.Lock()
+
+FANOUT_DECODERS = Gauge('fanout_decoders', 'Shared ffmpeg decoders feeding fan-out subscribers',
+                        lambda: len(_decoders))
+FANOUT_SUBSCRIBERS = Gauge('fanout_subscribers', 'Voice clients playing from a shared decoder',
+                           lambda: sum(d.subscribers for d in list(_decoders.values())))
+
+
+class _Decoder:
+    """Reads one Opus source in real time on its own thread and publishes frames to a ring buffer"""
+
+    def __init__(self, key, source):
+        self.key = key
+        self.source = source
+        self.frames = deque(maxlen=BUFFER_FRAMES)
+        self.head = 0  # sequence number of the next frame to be published
+        self.subscribers = 0
+        self.done = False
+        self.cond = threading.Condition()
+        threading.Thread(target=self._run, name=f'fanout-{key}'[:60], daemon=True).start()
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            while not self.done:
+                data = self.source.read()
+                with self.cond:
+                    if not data:
+                        break
+                    self.frames.append(data)
+                    self.head += 1
+                    self.cond.notify_all()
+                delay = start + self.head * FRAME_SECONDS - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        except Exception as e:
+            print(f"Fan-out decoder error for {self.key}: {e}")
+        finally:
+            with _lock:
+                if _decoders.get(self.key) is self:
+                    del _decoders[self.key]
+            with self.cond:
+                self.done = True
+                self.cond.notify_all()
+            self.source.cleanup()
+
+    def frame(self, seq):
+        """Frame seq, or the oldest one still buffered if seq has been overwritten.
+
+        None once the stream has ended, or if no new frame arrives within STALL_TIMEOUT.
+        """
+        with self.cond:
+            while seq >= self.head:
+                if self.done or not self.cond.wait(STALL_TIMEOUT):
+                    return None, seq
+            oldest = self.head - len(self.frames)
+            seq = max(seq, oldest)
+            return self.frames[seq - oldest], seq
+
+    def release(self):
+        with _lock:
+            self.subscribers -= 1
+            if self.subscribers:
+                return
+            if _decoders.get(self.key) is self:
+                del _decoders[self.key]
+        with self.cond:
+            self.done = True
+            self.cond.notify_all()
+
+
+class FanoutSource(discord.AudioSource):
+    """One voice client's view of a shared decoder; the frames are the decoder's own bytes objects.
+
+    A subscriber that falls out of the buffer (e.g. paused for longer than it
+    holds), or whose decoder stalls, leaves the decoder and continues from where
+    it was on a private source from open_private(position), rather than skipping
+    ahead or ending the track.
+    """
+
+    shared = True
+
+    def __init__(self, decoder, cursor, open_private):
+        self.decoder = decoder
+        self.cursor = cursor
+        self.offset = cursor * FRAME_SECONDS
+        self.open_private = open_private
+        self.private = None
+        self._released = False
+
+    def read(self):
+        if self.private is None:
+            data, seq = self.decoder.frame(self.cursor)
+            if data is not None and seq == self.cursor:
+                self.cursor += 1
+                return data
+            if data is None and self.decoder.done:
+                return b''
+            self._release()
+            self.private = self.open_private(self.cursor * FRAME_SECONDS)
+        return self.private.read()
+
+    def is_opus(self):
+        return True
+
+    def _release(self):
+        if not self._released:
+            self._released = True
+            self.decoder.release()
+
+    def cleanup(self):
+        self._release()
+        if self.private is not None:
+            self.private.cleanup()
+
+
+def subscribe(key, open_source, open_private):
+    """Join the decoder for key at its live position, starting one with open_source() if none is running"""
+    with _lock:
+        decoder = _decoders.get(key)
+        if decoder is not None and not decoder.done:
+            decoder.subscribers += 1
+            return FanoutSource(decoder, max(0, decoder.head - LIVE_DELAY_FRAMES), open_private)
+
+    source = open_source()
+    with _lock:
+        decoder = _decoders.get(key)
+        if decoder is not None and not decoder.done:
+            # Another guild started the same stream while ours was spawning
+            source.cleanup()
+            decoder.subscribers += 1
+            return FanoutSource(decoder, max(0, decoder.head - LIVE_DELAY_FRAMES), open_private)
+        decoder = _decoders[key] = _Decoder(key, source)
+        decoder.subscribers = 1
+        return FanoutSource(decoder, 0, open_private)
@@ -1,21 +1,85 @@
 import discord
 import asyncio
-from utils.config import FFMPEG_OPTIONS, FFMPEG_PATH
-from services.youtube import refresh_url
-from services.database import log_play
+import time
+from utils.config import FFMPEG_OPTIONS, FFMPEG_PATH, AUDIO_FANOUT
+from utils.metrics import Counter, Histogram, Gauge
+from utils.timerwheel import TimerWheel
+from utils.tracing import span, use_trace, record
+from services.youtube import refresh_url, cached_stream, STREAM_CACHE_HITS
+from services.database import log_play, get_coplay_candidates
+from services.track import Track, stream_url_stats
+from services.fanout import subscribe
 
 
 queues = {}
 current_tracks = {}
 _play_events = {}
 _player_tasks = {}
-_inactivity_tasks = {}
 _seeking = {}
 _loop_modes = {}
 _history = {}
 _skip_history = {}
+_sources = {}
+_text_channels = {}
+_np_messages = {}
+_np_status = {}
+_np_locks = {}
+_autoplay = set()
+# Autoplay's choice for after the current track, kept out of the queue so requests still go first
+_autoplay_next = {}
 INACTIVITY_TIMEOUT = 300
+NOW_PLAYING_DEBOUNCE = 3
+PREFETCH_LEAD = 30
 HISTORY_LIMIT = 10
+FRAME_SECONDS = 0.02
+
+# Shared scheduler for per-guild deadlines (inactivity, selection timeouts, prefetch)
+scheduler = TimerWheel(tick=1.0)
+
+CREATE_SOURCE_SECONDS = Histogram('create_source_seconds', 'Time spent in _create_source')
+PLAY_LATENCY_SECONDS = Histogram('play_to_first_audio_seconds', 'Time from /play to the first audio frame')
+TRANSITION_GAP_SECONDS = Histogram('track_transition_gap_seconds', 'Silence between the end of a track and the next frame')
+FFMPEG_PROCESSES = Gauge('ffmpeg_processes', 'Running ffmpeg processes')
+QUEUED_TRACKS = Gauge('queued_tracks', 'Tracks waiting in all guild queues',
+                      lambda: sum(len(q) for q in queues.values()))
+NOW_PLAYING_REQUESTS = Counter('now_playing_requests_total', 'Now-playing messages sent or edited')
+MAX_QUEUE_DEPTH = Gauge('max_queue_depth', 'Longest guild queue',
+                        lambda: max((len(q) for q in queues.values()), default=0))
+
+
+class _TrackedSource(discord.AudioSource):
+    """Wraps an audio source and counts frames read to know the playback position"""
+
+    def __init__(self, source, offset=0, on_first_frame=None):
+        self.source = source
+        self.offset = offset
+        self.frames = 0
+        self.on_first_frame = on_first_frame
+        # Fan-out subscribers share a decoder, which is counted by fanout_decoders instead
+        self._cleaned = getattr(source, 'shared', False)
+        if not self._cleaned:
+            FFMPEG_PROCESSES.inc()
+
+    def read(self):
+        data = self.source.read()
+        if data:
+            if not self.frames and self.on_first_frame:
+                self.on_first_frame(time.perf_counter())
+            self.frames += 1
+        return data
+
+    def is_opus(self):
+        return self.source.is_opus()
+
+    def cleanup(self):
+        if not self._cleaned:
+            self._cleaned = True
+            FFMPEG_PROCESSES.dec()
+        self.source.cleanup()
+
+    @property
+    def position(self):
+        return self.offset + self.frames * FRAME_SECONDS
 
 
 def parse_time(time_str):
@@ -32,7 +96,7 @@ def _format_duration(seconds):
     return f"{minutes}:{secs:02d}"
 
 
-def build_now_playing_embed(track):
+def build_now_playing_embed(track, queue=None, status=None):
     embed = discord.Embed(title=track['title'], color=discord.Color.blue())
     duration = _format_duration(track.get('duration'))
     if duration:
@@ -41,16 +105,113 @@ def build_now_playing_embed(track):
         embed.add_field(name="Source", value=f"[YouTube]({track['webpage_url']})", inline=True)
     if track.get('thumbnail'):
         embed.set_thumbnail(url=track['thumbnail'])
+    if queue:
+        embed.add_field(name="Up Next", value=f"{queue[0]['title']} · {len(queue)} in queue", inline=False)
+    if status:
+        embed.set_footer(text=status)
     return embed
 
 
-async def _create_source(track):
-    url = track['url']
+def refresh_now_playing(guild_id):
+    """Coalesce now-playing updates (queue changes, ingestion progress) into one edit"""
+    key = ('now_playing', guild_id)
+    if guild_id in _np_messages and key not in scheduler:
+        scheduler.arm(key, NOW_PLAYING_DEBOUNCE, lambda: _flush_now_playing(guild_id))
+
+
+async def set_now_playing_status(guild_id, channel, text, final=False):
+    """Show a status line in the now-playing message, or post it on its own if nothing is playing"""
+    if guild_id in _np_messages:
+        _np_status[guild_id] = (text, final)
+        refresh_now_playing(guild_id)
+    elif final:
+        try:
+            await channel.send(text, delete_after=10)
+        except Exception:
+            pass
+
+
+async def _flush_now_playing(guild_id, channel=None):
+    """Edit the guild's now-playing message in place, posting a new one only when needed"""
+    scheduler.cancel(('now_playing', guild_id))
+    lock = _np_locks.setdefault(guild_id, asyncio.Lock())
+    async with lock:
+        track = current_tracks.get(guild_id)
+        channel = channel or _text_channels.get(guild_id)
+        if not track or not channel:
+            return
+        status = _np_status.get(guild_id)
+        embed = build_now_playing_embed(track, queues.get(guild_id), status[0] if status else None)
+
+        rendered = embed.to_dict()
+        message, shown = _np_messages.get(guild_id, (None, None))
+        if message and getattr(message.channel, 'id', None) == channel.id:
+            if shown == rendered:
+                return
+            try:
+                NOW_PLAYING_REQUESTS.inc(kind='edit')
+                _np_messages[guild_id] = (await message.edit(embed=embed) or message, rendered)
+                return
+            except discord.NotFound:
+                pass
+            except discord.HTTPException as e:
+                print(f"Error updating now playing for guild {guild_id}: {e}")
+                return
+
+        try:
+            NOW_PLAYING_REQUESTS.inc(kind='send')
+            _np_messages[guild_id] = (await channel.send(embed=embed), rendered)
+        except Exception as e:
+            print(f"Error sending now playing for guild {guild_id}: {e}")
+
+
+def _ffmpeg_options(start_at=0):
+    if not start_at:
+        return FFMPEG_OPTIONS
+    return {
+        **FFMPEG_OPTIONS,
+        'before_options': f"{FFMPEG_OPTIONS['before_options']} -ss {start_at}",
+    }
+
+
+async def _create_source(track, start_at=0, shared=True):
+    with CREATE_SOURCE_SECONDS.time():
+        return await _open_source(track, start_at, shared)
+
+
+def _cached_url(webpage_url):
+    song = cached_stream(webpage_url)
+    if not song:
+        return None
+    STREAM_CACHE_HITS.inc()
+    return song['url']
+
+
+async def _open_source(track, start_at=0, shared=True):
+    url = track.get('url')
+    if not url and 'webpage_url' in track:
+        # Saved playlists queue tracks by video id only; resolve here if the prefetch didn't
+        url = _cached_url(track['webpage_url']) or await refresh_url(track['webpage_url'])
+        if not url:
+            return None
+        track['url'] = url
     for attempt in range(2):
         try:
-            return discord.FFmpegPCMAudio(
-                url, **FFMPEG_OPTIONS, executable=FFMPEG_PATH
+            if AUDIO_FANOUT and shared and not start_at:
+                # One Opus decoder per stream for every guild playing it; joiners start at its live position
+                source = subscribe(
+                    track.get('webpage_url') or url,
+                    lambda: discord.FFmpegOpusAudio(url, **FFMPEG_OPTIONS, executable=FFMPEG_PATH),
+                    # Tracked so a subscriber's private fallback shows up in ffmpeg_processes
+                    lambda pos: _TrackedSource(
+                        discord.FFmpegOpusAudio(url, **_ffmpeg_options(pos), executable=FFMPEG_PATH)
+                    )
+                )
+                return _TrackedSource(source, source.offset)
+            source = discord.FFmpegPCMAudio(
+                url, **_ffmpeg_options(start_at), executable=FFMPEG_PATH
             )
+            return _TrackedSource(source, start_at)
         except Exception as e:
             print(f"FFmpegPCMAudio attempt {attempt + 1} failed: {e}")
             if attempt == 0 and 'webpage_url' in track:
@@ -73,33 +234,65 @@ def signal_next(guild_id):
         _play_events[guild_id].set()
 
 
-async def start_player(voice_client, track, guild_id, channel):
-    if guild_id in _player_tasks:
-        task = _player_tasks[guild_id]
-        if not task.done():
-            add_to_queue(guild_id, track)
-            return
+def is_active(guild_id):
+    task = _player_tasks.get(guild_id)
+    return task is not None and not task.done()
+
+
+async def start_player(voice_client, track, guild_id, channel, start_at=0, requested_at=None, source=None):
+    """Start the guild's player, or queue the track if one is running; source may be pre-spawned"""
+    track = Track.coerce(track)
+    if is_active(guild_id):
+        if source:
+            source.cleanup()
+        add_to_queue(guild_id, track)
+        return
 
     _cancel_inactivity_timer(guild_id)
+    _text_channels[guild_id] = channel
     _player_tasks[guild_id] = asyncio.create_task(
-        _player_loop(voice_client, track, guild_id, channel)
+        _player_loop(voice_client, track, guild_id, channel, start_at, requested_at, source)
     )
 
 
-async def _player_loop(voice_client, first_track, guild_id, channel):
+def _first_frame_observer(requested_at, ended_at, trace_id=None):
+    def observe(now):
+        if requested_at is not None:
+            PLAY_LATENCY_SECONDS.observe(now - requested_at)
+            record('player.first_audio', now - requested_at, trace_id)
+        elif ended_at is not None:
+            TRANSITION_GAP_SECONDS.observe(now - ended_at)
+            record('player.transition_gap', now - ended_at, trace_id)
+    return observe
+
+
+async def _player_loop(voice_client, first_track, guild_id, channel, start_at=0, requested_at=None, prepared=None):
     event = _get_event(guild_id)
     loop = asyncio.get_running_loop()
     track = first_track
+    ended_at = None
+    repeating = False
+    autoplayed = False
 
     try:
         while track:
-            source = await _create_source(track)
+            trace_id = track.get('trace_id')
+            source, prepared = prepared, None
+            if not source:
+                with use_trace(trace_id), span('player.create_source'):
+                    # A repeat starts the track over rather than joining a shared decoder mid-way
+                    source = await _create_source(track, start_at, shared=not repeating)
+            start_at = 0
             if not source:
                 print(f"Failed to create source for: {track.get('title')}")
                 track = _next_track(guild_id)
+                autoplayed = False
                 continue
+            source.on_first_frame = _first_frame_observer(requested_at, ended_at, trace_id)
+            requested_at = None
 
             current_tracks[guild_id] = track
+            _sources[guild_id] = source
             event.clear()
 
             try:
@@ -107,7 +300,8 @@ async def _player_loop(voice_client, first_track, guild_id, channel):
                     guild_id,
                     track.get('requested_by', 0),
                     track['title'],
-                    track.get('webpage_url')
+                    track.get('webpage_url'),
+                    autoplay=autoplayed
                 )
             except Exception:
                 pass
@@ -116,20 +310,23 @@ async def _player_loop(voice_client, first_track, guild_id, channel):
                 source,
                 after=lambda e, gid=guild_id, lp=loop: _on_track_end(e, gid, lp)
             )
+            _schedule_prefetch(guild_id, track)
 
-            try:
-                embed = build_now_playing_embed(track)
-                await channel.send(embed=embed)
-            except Exception:
-                pass
+            status = _np_status.get(guild_id)
+            if status and status[1]:
+                del _np_status[guild_id]
+            with use_trace(trace_id), span('discord.now_playing'):
+                await _flush_now_playing(guild_id, channel)
 
             await event.wait()
+            ended_at = time.perf_counter()
 
             if not voice_client.is_connected():
                 break
 
             mode = _loop_modes.get(guild_id, 'off')
-            if mode == 'track':
+            repeating = mode == 'track'
+            if repeating:
                 pass
             else:
                 if not _skip_history.get(guild_id):
@@ -141,26 +338,93 @@ async def _player_loop(voice_client, first_track, guild_id, channel):
                 _skip_history[guild_id] = False
                 if mode == 'queue':
                     add_to_queue(guild_id, track)
-                track = _next_track(guild_id)
+                next_track = _next_track(guild_id)
+                held = _autoplay_next.pop(guild_id, None)
+                autoplayed = next_track is None and guild_id in _autoplay
+                if autoplayed:
+                    next_track = held or _autoplay_pick(guild_id, track)
+                track = next_track
     except asyncio.CancelledError:
         raise
     except Exception as e:
         print(f"Player loop error for guild {guild_id}: {e}")
     finally:
+        if prepared:
+            prepared.cleanup()
         if guild_id in current_tracks:
             del current_tracks[guild_id]
+        if guild_id in _sources:
+            del _sources[guild_id]
         if guild_id in _player_tasks:
             del _player_tasks[guild_id]
+        _np_messages.pop(guild_id, None)
+        _np_status.pop(guild_id, None)
+        _autoplay_next.pop(guild_id, None)
+        scheduler.cancel(('now_playing', guild_id))
+        scheduler.cancel(('prefetch', guild_id))
+        if _play_events.get(guild_id) is event:
+            del _play_events[guild_id]
         if voice_client.is_connected():
             _start_inactivity_timer(voice_client, guild_id)
 
 
+def _autoplay_pick(guild_id, track):
+    """Next track from the co-play index, skipping anything played recently"""
+    if not track.get('webpage_url'):
+        return None
+    try:
+        candidates = get_coplay_candidates(guild_id, track['webpage_url'])
+    except Exception as e:
+        print(f"Error reading autoplay candidates: {e}")
+        return None
+    recent = {t.get('webpage_url') for t in _history.get(guild_id, [])}
+    recent.add(track['webpage_url'])
+    for row in candidates:
+        if row['next_url'] not in recent:
+            return Track(title=row['next_title'], webpage_url=row['next_url'])
+    return None
+
+
+def toggle_autoplay(guild_id):
+    if guild_id in _autoplay:
+        _autoplay.discard(guild_id)
+        _autoplay_next.pop(guild_id, None)
+        return False
+    _autoplay.add(guild_id)
+    return True
+
+
+def _schedule_prefetch(guild_id, track):
+    """Resolve the next queued track's stream URL shortly before the current one ends"""
+    delay = max(0, (track.get('duration') or 0) - PREFETCH_LEAD)
+    scheduler.arm(('prefetch', guild_id), delay, lambda: _prefetch_next(guild_id))
+
+
+async def _prefetch_next(guild_id):
+    queue = queues.get(guild_id)
+    if queue:
+        track = queue[0]
+    elif guild_id in _autoplay and guild_id in current_tracks:
+        # Resolve autoplay's pick early, but only hold it; it plays if the queue is still empty at the end
+        track = _autoplay_next.get(guild_id) or _autoplay_pick(guild_id, current_tracks[guild_id])
+        if not track:
+            return
+        _autoplay_next[guild_id] = track
+    else:
+        return
+    if 'url' in track or 'webpage_url' not in track:
+        return
+    url = _cached_url(track['webpage_url']) or await refresh_url(track['webpage_url'], background=True)
+    if url and 'url' not in track:
+        track['url'] = url
+
+
 def _on_track_end(error, guild_id, loop):
     if error:
         print(f"Player error: {error}")
     if _seeking.get(guild_id):
         return
-    loop.call_soon_threadsafe(_play_events[guild_id].set)
+    loop.call_soon_threadsafe(signal_next, guild_id)
 
 
 async def seek_track(voice_client, guild_id, pos_sec):
@@ -176,12 +440,9 @@ async def seek_track(voice_client, guild_id, pos_sec):
             url = new_url
 
     try:
-        source = discord.FFmpegPCMAudio(
-            url,
-            before_options=f"-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -ss {pos_sec}",
-            options="-vn",
-            executable=FFMPEG_PATH
-        )
+        source = _TrackedSource(discord.FFmpegPCMAudio(
+            url, **_ffmpeg_options(pos_sec), executable=FFMPEG_PATH
+        ), pos_sec)
     except Exception:
         return False
 
@@ -191,6 +452,7 @@ async def seek_track(voice_client, guild_id, pos_sec):
     await asyncio.sleep(0.05)
     _seeking[guild_id] = False
 
+    _sources[guild_id] = source
     voice_client.play(
         source,
         after=lambda e, gid=guild_id, lp=loop: _on_track_end(e, gid, lp)
@@ -207,7 +469,15 @@ def _next_track(guild_id):
 def add_to_queue(guild_id, track):
     if guild_id not in queues:
         queues[guild_id] = []
-    queues[guild_id].append(track)
+    queues[guild_id].append(Track.coerce(track))
+    refresh_now_playing(guild_id)
+
+
+def extend_queue(guild_id, tracks):
+    if guild_id not in queues:
+        queues[guild_id] = []
+    queues[guild_id].extend(Track.coerce(t) for t in tracks)
+    refresh_now_playing(guild_id)
 
 
 def clear_queue(guild_id):
@@ -215,10 +485,21 @@ def clear_queue(guild_id):
         del queues[guild_id]
     if guild_id in current_tracks:
         del current_tracks[guild_id]
+    if guild_id in _sources:
+        del _sources[guild_id]
+    if guild_id in _text_channels:
+        del _text_channels[guild_id]
+    _np_messages.pop(guild_id, None)
+    _np_status.pop(guild_id, None)
+    _np_locks.pop(guild_id, None)
+    scheduler.cancel(('now_playing', guild_id))
+    scheduler.cancel(('prefetch', guild_id))
     if guild_id in _seeking:
         del _seeking[guild_id]
     if guild_id in _loop_modes:
         del _loop_modes[guild_id]
+    _autoplay.discard(guild_id)
+    _autoplay_next.pop(guild_id, None)
     if guild_id in _history:
         del _history[guild_id]
     if guild_id in _skip_history:
@@ -231,6 +512,60 @@ def clear_queue(guild_id):
     _cancel_inactivity_timer(guild_id)
 
 
+def get_position(guild_id):
+    source = _sources.get(guild_id)
+    return source.position if source else 0
+
+
+def get_snapshot(guild_id):
+    """Serializable view of a guild's playback state, or None when idle"""
+    track = current_tracks.get(guild_id)
+    if not track:
+        return None
+    channel = _text_channels.get(guild_id)
+    return {
+        'guild_id': guild_id,
+        'text_channel_id': channel.id if channel else None,
+        'current_track': track.to_dict(),
+        'position': get_position(guild_id),
+        'queue': [t.to_dict() for t in queues.get(guild_id, [])],
+        'loop_mode': _loop_modes.get(guild_id, 'off'),
+    }
+
+
+def restore_state(guild_id, queue, loop_mode='off'):
+    # Saved stream URLs have likely expired; drop them so each track resolves again before it plays
+    queues[guild_id] = [
+        Track.coerce({k: v for k, v in t.items() if k != 'url' or not t.get('webpage_url')})
+        for t in queue
+    ]
+    if loop_mode != 'off':
+        _loop_modes[guild_id] = loop_mode
+
+
+def guild_memory(guild_id):
+    """Tracks held for a guild (current, queue and history) and approximate bytes used"""
+    tracks = list(queues.get(guild_id, [])) + list(_history.get(guild_id, []))
+    if guild_id in current_tracks:
+        tracks.append(current_tracks[guild_id])
+    seen = set()
+    return len(tracks), sum(t.footprint(seen) for t in tracks)
+
+
+def memory_report():
+    guild_ids = set(queues) | set(current_tracks) | set(_history)
+    per_guild = {gid: guild_memory(gid) for gid in guild_ids}
+    urls, url_bytes = stream_url_stats()
+    return {
+        'guilds': len(per_guild),
+        'tracks': sum(n for n, _ in per_guild.values()),
+        'bytes': sum(b for _, b in per_guild.values()),
+        'stream_urls': urls,
+        'stream_url_bytes': url_bytes,
+        'largest': sorted(per_guild.items(), key=lambda kv: kv[1][1], reverse=True)[:5],
+    }
+
+
 def cycle_loop_mode(guild_id):
     current = _loop_modes.get(guild_id, 'off')
     modes = ['off', 'track', 'queue']
@@ -251,28 +586,20 @@ def skip_history_once(guild_id):
 
 
 def _cancel_inactivity_timer(guild_id):
-    if guild_id in _inactivity_tasks:
-        _inactivity_tasks[guild_id].cancel()
-        del _inactivity_tasks[guild_id]
+    scheduler.cancel(('inactivity', guild_id))
 
 
 def _start_inactivity_timer(voice_client, guild_id):
-    _cancel_inactivity_timer(guild_id)
-    _inactivity_tasks[guild_id] = asyncio.create_task(
-        _inactivity_disconnect(voice_client, guild_id)
+    scheduler.arm(
+        ('inactivity', guild_id), INACTIVITY_TIMEOUT,
+        lambda: _inactivity_disconnect(voice_client, guild_id)
     )
 
 
 async def _inactivity_disconnect(voice_client, guild_id):
     try:
-        await asyncio.sleep(INACTIVITY_TIMEOUT)
         if voice_client.is_connected() and not voice_client.is_playing() and not voice_client.is_paused():
             await voice_client.disconnect()
             print(f"⏱️ Disconnected from guild {guild_id} due to inactivity")
-    except asyncio.CancelledError:
-        pass
     except Exception:
         pass
-    finally:
-        if guild_id in _inactivity_tasks:
-            del _inactivity_tasks[guild_id]
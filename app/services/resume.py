@@ -0,0 +1,86 @@
+import asyncio
+from utils.config import SNAPSHOT_INTERVAL
+from services.music import get_snapshot, restore_state, start_player
+from services.youtube import refresh_url
+from services.database import save_snapshots, load_snapshots
+
+_resumed = False
+
+
+def _collect_snapshots(bot):
+    snapshots = []
+    for voice_client in bot.voice_clients:
+        if not voice_client.is_connected() or not voice_client.channel:
+            continue
+        snapshot = get_snapshot(voice_client.guild.id)
+        if snapshot:
+            snapshot['voice_channel_id'] = voice_client.channel.id
+            snapshot['position'] = round(snapshot['position'], 2)
+            snapshots.append(snapshot)
+    return snapshots
+
+
+async def snapshot_loop(bot):
+    """Periodically persist every guild's queue, current track and position"""
+    while not bot.is_closed():
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            save_snapshots(_collect_snapshots(bot))
+        except Exception as e:
+            print(f"Error saving playback snapshots: {e}")
+
+
+async def _resume_guild(bot, snapshot):
+    voice_channel = bot.get_channel(snapshot['voice_channel_id'])
+    track = snapshot['current_track']
+    if not voice_channel or not track:
+        return False
+    if not any(not m.bot for m in voice_channel.members):
+        return False
+
+    guild = voice_channel.guild
+    connect = (
+        guild.voice_client.move_to(voice_channel)
+        if guild.voice_client else voice_channel.connect()
+    )
+    refresh = refresh_url(track['webpage_url']) if track.get('webpage_url') else asyncio.sleep(0)
+    voice_result, new_url = await asyncio.gather(connect, refresh, return_exceptions=True)
+
+    if isinstance(voice_result, Exception):
+        print(f"Error reconnecting to guild {guild.id}: {voice_result}")
+        return False
+    voice_client = guild.voice_client
+    if not voice_client:
+        return False
+    if isinstance(new_url, str):
+        track['url'] = new_url
+    elif track.get('webpage_url'):
+        # Resolve again when the player starts rather than trying the expired URL
+        track.pop('url', None)
+
+    text_channel = bot.get_channel(snapshot['text_channel_id'] or 0) or voice_channel
+    restore_state(guild.id, snapshot['queue'], snapshot['loop_mode'])
+    await start_player(voice_client, track, guild.id, text_channel, start_at=snapshot['position'])
+    return True
+
+
+async def resume_sessions(bot):
+    """Reconnect to the voice channels saved before the last shutdown and resume playback"""
+    global _resumed
+    if _resumed:
+        return
+    _resumed = True
+
+    try:
+        snapshots = load_snapshots()
+    except Exception as e:
+        print(f"Error loading playback snapshots: {e}")
+        snapshots = []
+
+    if snapshots:
+        results = await asyncio.gather(
+            *[_resume_guild(bot, s) for s in snapshots],
+            return_exceptions=True
+        )
+        resumed = sum(1 for r in results if r is True)
+        print(f"▶️ Resumed playback in {resumed}/{len(snapshots)} guilds")
@@ -1,17 +1,27 @@
 import asyncio
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
 from services.youtube import get_youtube_url
-from services.music import add_to_queue
+from services.music import add_to_queue, set_now_playing_status
 from utils.config import SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_MARKET, MAX_PLAYLIST_TRACKS
+from utils.metrics import Histogram
+from utils.tracing import span
+
+SPOTIFY_API_SECONDS = Histogram('spotify_api_seconds', 'Time spent in Spotify Web API calls')
 
 
 sp = None
-if SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET:
-    sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(
-        client_id=SPOTIFY_CLIENT_ID,
-        client_secret=SPOTIFY_CLIENT_SECRET
-    ))
+
+
+def _get_client():
+    """Build the Spotify client on first use so startup doesn't pay for spotipy"""
+    global sp
+    if sp is None and SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET:
+        import spotipy
+        from spotipy.oauth2 import SpotifyClientCredentials
+        sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(
+            client_id=SPOTIFY_CLIENT_ID,
+            client_secret=SPOTIFY_CLIENT_SECRET
+        ))
+    return sp
 
 
 def _format_track(track):
@@ -32,10 +42,12 @@ def _format_track(track):
 
 
 async def get_spotify_track(track_id):
-    if not sp:
+    client = _get_client()
+    if not client:
         return None
     try:
-        track = sp.track(track_id, market=SPOTIFY_MARKET)
+        with SPOTIFY_API_SECONDS.time(call='track'), span('spotify.track'):
+            track = client.track(track_id, market=SPOTIFY_MARKET)
         return _format_track(track)
     except Exception as e:
         print(f"Error fetching Spotify track: {e}")
@@ -52,15 +64,17 @@ def _extract_tracks(items):
 
 
 async def get_spotify_playlist(playlist_id):
-    if not sp:
+    client = _get_client()
+    if not client:
         return []
     try:
         tracks = []
         offset = 0
         while True:
-            results = sp.playlist_items(
-                playlist_id, limit=100, offset=offset, market=SPOTIFY_MARKET
-            )
+            with SPOTIFY_API_SECONDS.time(call='playlist_items'), span('spotify.playlist_items', offset=offset):
+                results = client.playlist_items(
+                    playlist_id, limit=100, offset=offset, market=SPOTIFY_MARKET
+                )
             tracks.extend(_extract_tracks(results['items']))
             if not results['next']:
                 break
@@ -74,14 +88,17 @@ async def get_spotify_playlist(playlist_id):
 
 
 async def get_spotify_album(album_id):
-    if not sp:
+    client = _get_client()
+    if not client:
         return []
     try:
-        results = sp.album_tracks(album_id, limit=50, market=SPOTIFY_MARKET)
+        with SPOTIFY_API_SECONDS.time(call='album_tracks'), span('spotify.album_tracks'):
+            results = client.album_tracks(album_id, limit=50, market=SPOTIFY_MARKET)
         tracks = _extract_tracks(results['items'])
 
         while results['next']:
-            results = sp.next(results)
+            with SPOTIFY_API_SECONDS.time(call='next'), span('spotify.next'):
+                results = client.next(results)
             tracks.extend(_extract_tracks(results['items']))
 
         print(f"✅ Loaded {len(tracks)} tracks from album")
@@ -91,9 +108,11 @@ async def get_spotify_album(album_id):
         return []
 
 
-async def _resolve_track(track):
+async def _resolve_track(track, background=False):
     try:
-        youtube_info = await get_youtube_url(track['search_query'])
+        youtube_info = await get_youtube_url(
+            track['search_query'], background=background, duration=track.get('duration')
+        )
         if youtube_info:
             return {
                 'url': youtube_info['url'],
@@ -107,16 +126,23 @@ async def _resolve_track(track):
     return None
 
 
-async def process_spotify_tracks(tracks, guild_id, channel, user_id=0):
+async def process_spotify_tracks(tracks, guild_id, channel, user_id=0, pending=()):
+    """Resolve and queue tracks in batches; pending holds resolutions already running for the first tracks"""
+    pending = list(pending)
     max_tracks = min(MAX_PLAYLIST_TRACKS, len(tracks))
     batch_size = 5
     processed = 0
     failed = 0
 
     for i in range(0, max_tracks, batch_size):
+        if i:
+            await set_now_playing_status(guild_id, channel, f"⏳ Adding tracks... {i}/{max_tracks}")
         batch = tracks[i:i + batch_size]
         results = await asyncio.gather(
-            *[_resolve_track(t) for t in batch],
+            *[
+                pending[i + j] if i + j < len(pending) else _resolve_track(t, background=True)
+                for j, t in enumerate(batch)
+            ],
             return_exceptions=True
         )
         for result in results:
@@ -131,4 +157,4 @@ async def process_spotify_tracks(tracks, guild_id, channel, user_id=0):
         status = f"✅ {processed} tracks added to queue"
         if failed > 0:
             status += f" ({failed} failed)"
-        await channel.send(status, delete_after=10)
+        await set_now_playing_status(guild_id, channel, status, final=True)
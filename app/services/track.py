@@ -0,0 +1,127 @@
+import sys
+
+FIELDS = ('url', 'title', 'webpage_url', 'duration', 'thumbnail', 'requested_by', 'trace_id')
+
+# Signed stream URLs are long and identical for every queue entry of the same
+# video, so they are stored once per webpage_url: {webpage_url: [url, references]}
+_stream_urls = {}
+_SHARED = object()
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) and value else value or None
+
+
+class Track:
+    """Compact queue entry that still reads like the dicts the rest of the bot passes around"""
+
+    __slots__ = ('title', 'webpage_url', 'duration', 'thumbnail', 'requested_by', 'trace_id', '_url')
+
+    def __init__(self, url=None, title='Unknown', webpage_url=None, duration=None,
+                 thumbnail=None, requested_by=0, trace_id=None):
+        self._url = None
+        self.title = _intern(title) or 'Unknown'
+        self.webpage_url = _intern(webpage_url)
+        self.duration = duration
+        self.thumbnail = _intern(thumbnail)
+        self.requested_by = requested_by
+        self.trace_id = trace_id
+        self.url = url
+
+    @classmethod
+    def coerce(cls, track):
+        if isinstance(track, cls):
+            return track
+        return cls(**{k: v for k, v in track.items() if k in FIELDS})
+
+    @property
+    def url(self):
+        if self._url is _SHARED:
+            return _stream_urls[self.webpage_url][0]
+        return self._url
+
+    @url.setter
+    def url(self, value):
+        if not value or not self.webpage_url:
+            self._release()
+            self._url = value or None
+            return
+        entry = _stream_urls.get(self.webpage_url)
+        if entry is None:
+            self._release()
+            _stream_urls[self.webpage_url] = [value, 1]
+        else:
+            entry[0] = value
+            if self._url is not _SHARED:
+                entry[1] += 1
+        self._url = _SHARED
+
+    def _release(self):
+        if self._url is _SHARED:
+            entry = _stream_urls[self.webpage_url]
+            entry[1] -= 1
+            if not entry[1]:
+                del _stream_urls[self.webpage_url]
+        self._url = None
+
+    def __del__(self):
+        try:
+            self._release()
+        except Exception:
+            pass
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in FIELDS:
+            raise KeyError(key)
+        if key == 'webpage_url':
+            url = self.url
+            self._release()
+            self.webpage_url = _intern(value)
+            self.url = url
+        elif key in ('title', 'thumbnail'):
+            setattr(self, key, _intern(value))
+        else:
+            setattr(self, key, value)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        if key not in FIELDS:
+            return default
+        value = getattr(self, key)
+        return default if value is None else value
+
+    def keys(self):
+        return [k for k in FIELDS if getattr(self, k) is not None]
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in self.keys()}
+
+    def footprint(self, seen):
+        """Approximate bytes held by this track, skipping objects already counted in seen"""
+        if id(self) in seen:
+            return 0
+        seen.add(id(self))
+        total = sys.getsizeof(self)
+        for value in (self.title, self.webpage_url, self.duration, self.thumbnail,
+                      self.requested_by, self.trace_id, self._url):
+            if value is None or value is _SHARED or id(value) in seen:
+                continue
+            seen.add(id(value))
+            total += sys.getsizeof(value)
+        if self._url is _SHARED:
+            url, references = _stream_urls[self.webpage_url]
+            total += sys.getsizeof(url) / references
+        return int(total)
+
+
+def stream_url_stats():
+    """Number of distinct stream URLs held and the bytes they use"""
+    return len(_stream_urls), sum(sys.getsizeof(url) for url, _ in _stream_urls.values())
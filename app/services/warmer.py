@@ -0,0 +1,81 @@
+import asyncio
+from utils.config import WARM_INTERVAL, WARM_TRACKS, WARM_ACTIVE_HOURS, WARM_MAX_PER_PASS
+from utils.metrics import Counter
+from services.database import get_top_tracks, get_recent, get_active_guilds
+from services.youtube import get_youtube_url, cached_stream, extraction_idle, stream_cache_room
+
+TRACKS_WARMED = Counter('warmer_tracks_warmed_total', 'Tracks pre-resolved from play history while idle')
+WARM_SKIPPED = Counter('warmer_tracks_skipped_total', 'History tracks not warmed because the stream cache was full')
+IDLE_POLL = 1.0
+
+
+def _history_urls(guild_id):
+    """Distinct video URLs from the guild's most played and most recently played tracks"""
+    urls = []
+    for row in [*get_top_tracks(guild_id, WARM_TRACKS), *get_recent(guild_id, WARM_TRACKS)]:
+        url = row['track_url']
+        if url and url not in urls:
+            urls.append(url)
+    return urls
+
+
+def _active_guilds(bot):
+    """Guilds in voice right now, then guilds that played something recently, most recent first"""
+    guild_ids = [vc.guild.id for vc in bot.voice_clients if vc.guild]
+    for guild_id in get_active_guilds(WARM_ACTIVE_HOURS, WARM_MAX_PER_PASS):
+        if guild_id not in guild_ids:
+            guild_ids.append(guild_id)
+    return guild_ids
+
+
+async def warm_guild(guild_id, budget=WARM_MAX_PER_PASS):
+    """Resolve up to budget history tracks that aren't cached, one at a time and only while extraction is idle.
+
+    Stops without extracting once the stream cache has no free slot, since a
+    warmed entry never evicts one a listener put there.
+    """
+    attempted = warmed = 0
+    for url in _history_urls(guild_id):
+        if attempted >= budget:
+            break
+        if cached_stream(url, touch=False):
+            continue
+        while not extraction_idle():
+            await asyncio.sleep(IDLE_POLL)
+        if not stream_cache_room():
+            WARM_SKIPPED.inc()
+            break
+        attempted += 1
+        if not await get_youtube_url(url, background=True, warm=True):
+            continue
+        if cached_stream(url, touch=False):
+            warmed += 1
+            TRACKS_WARMED.inc()
+        else:
+            # A listener filled the last slot while this one was resolving
+            WARM_SKIPPED.inc()
+    return attempted, warmed
+
+
+async def warm_loop(bot):
+    """Periodically warm the stream cache for active guilds, within a per-pass extraction budget"""
+    while not bot.is_closed():
+        await asyncio.sleep(WARM_INTERVAL)
+        budget = WARM_MAX_PER_PASS
+        warmed = 0
+        try:
+            guild_ids = _active_guilds(bot)
+        except Exception as e:
+            print(f"Error listing guilds to warm: {e}")
+            continue
+        for guild_id in guild_ids:
+            if budget <= 0 or not stream_cache_room():
+                break
+            try:
+                attempted, done = await warm_guild(guild_id, budget)
+                budget -= attempted
+                warmed += done
+            except Exception as e:
+                print(f"Error warming guild {guild_id}: {e}")
+        if warmed:
+            print(f"🔥 Warmed {warmed} tracks from play history")
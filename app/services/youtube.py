@@ -1,21 +1,292 @@
 import asyncio
-import yt_dlp as youtube_dl
-from utils.config import YDL_OPTS
+import re
+import time
+from collections import deque, OrderedDict
+from urllib.parse import urlparse, parse_qs
+from utils.config import (
+    YDL_OPTS, YDL_FLAT_OPTS, YDL_PLAYLIST_OPTS, YTDL_RATE, YTDL_BURST, SEARCH_CANDIDATES,
+    YOUTUBE_PLAYLIST_PATTERN, YTDL_HEDGE_PERCENTILE, YTDL_HEDGE_CLIENT
+)
+from utils.metrics import Histogram, Gauge, Counter
+from utils.ratelimit import AdaptiveLimiter, Ticket, CLOSED, HALF_OPEN, OPEN
+from utils.tracing import span
+from services.database import (
+    get_failed_lookup, record_failed_lookup, clear_failed_lookup, get_resolved_lookup, set_resolved_lookup
+)
 
+EXTRACTION_SECONDS = Histogram('ytdlp_extraction_seconds', 'Time spent in yt-dlp extract_info')
+PENDING_EXTRACTIONS = Gauge('ytdlp_pending_extractions', 'yt-dlp extractions queued or running')
+EXTRACTIONS_COALESCED = Counter(
+    'ytdlp_extractions_coalesced_total', 'Extractions avoided by joining an identical in-flight request'
+)
 
-def _extract_info(yt_query):
-    with youtube_dl.YoutubeDL(YDL_OPTS) as ydl:
+RATE_LIMITED = Counter('ytdlp_rate_limited_total', 'Extractions rejected by YouTube rate limiting or bot checks')
+HEDGED_EXTRACTIONS = Counter('ytdlp_hedged_extractions_total', 'Interactive extractions that launched a second attempt')
+HEDGE_WINS = Counter('ytdlp_hedge_wins_total', 'Hedged extractions by which attempt finished first')
+
+NEGATIVE_CACHE_HITS = Counter('ytdlp_negative_cache_hits_total', 'Lookups skipped because they recently failed')
+NEGATIVE_CACHE_TTL = 3600
+NEGATIVE_CACHE_MAX_TTL = 7 * 24 * 3600
+# Extractor errors that won't go away by retrying; anything else (timeouts, 5xx, DNS) is not cached
+PERMANENT_FAILURE_MARKERS = (
+    'video unavailable', 'private video', 'has been removed', 'no longer available',
+    'has been terminated', 'not available in your country', 'blocked it in your country',
+    'members-only', 'no search results',
+)
+_failed = set()
+
+STREAM_CACHE_HITS = Counter('ytdlp_stream_cache_hits_total', 'Resolutions answered from cached streams')
+STREAM_CACHE_SIZE = 2000
+STREAM_TTL = 4 * 3600
+STREAM_EXPIRY_MARGIN = 600
+RESOLVE_CACHE_DAYS = 30
+# {video_id: (expires_at, song)}, least recently used first
+_streams = OrderedDict()
+
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY = 5.0
+HEDGE_MIN_DELAY = 1.0
+_latencies = {False: deque(maxlen=200), True: deque(maxlen=200)}
+
+EXTRACTION_TIMEOUT = 30
+RATE_LIMIT_MARKERS = ('429', 'too many requests', 'sign in to confirm', 'not a bot', 'rate-limit', 'rate limit')
+_limiter = AdaptiveLimiter(YTDL_RATE, YTDL_BURST)
+
+CIRCUIT_STATE = Gauge(
+    'ytdlp_circuit_state', 'Extraction circuit breaker: 0 closed, 1 half-open, 2 open',
+    lambda: {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}[_limiter.state]
+)
+EXTRACTION_RATE = Gauge('ytdlp_extraction_rate', 'Current extraction token refill rate per second',
+                        lambda: _limiter.rate)
+_VIDEO_ID = re.compile(r'(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/)([A-Za-z0-9_-]{11})')
+_SEARCH_PREFIX = re.compile(r'^(ytsearch\d*):', re.IGNORECASE)
+_inflight = {}
+youtube_dl = None
+_NOISE_TERMS = (
+    'live', 'cover', 'remix', 'karaoke', 'instrumental', 'sped up', 'slowed', 'reverb',
+    'nightcore', '8d', 'reaction', 'tutorial', 'lesson', 'full album', 'hour',
+)
+
+
+def _ydl_module():
+    """Import yt-dlp on first extraction rather than at startup"""
+    global youtube_dl
+    if youtube_dl is None:
+        import yt_dlp
+        youtube_dl = yt_dlp
+    return youtube_dl
+
+
+def _extract_info(yt_query, opts=YDL_OPTS):
+    with _ydl_module().YoutubeDL(opts) as ydl:
         return ydl.extract_info(yt_query, download=False)
 
 
-async def _extract_with_timeout(yt_query, timeout=30):
+def _coalesce_key(yt_query, flat=False, playlist_end=None, playlist_start=1):
+    """Normalize a query so equivalent searches and URLs share one extraction"""
+    if playlist_end:
+        return f'playlist:{playlist_id(yt_query)}:{playlist_start}:{playlist_end}'
+    if yt_query.startswith(('http://', 'https://')):
+        match = _VIDEO_ID.search(yt_query)
+        key = f'video:{match.group(1)}' if match else yt_query.strip()
+    else:
+        match = _SEARCH_PREFIX.match(yt_query)
+        terms = yt_query[match.end():] if match else yt_query
+        key = ' '.join(terms.lower().split())
+        if match:
+            key = f'{match.group(1).lower()}:{key}'
+    return f'flat:{key}' if flat else key
+
+
+def video_id(url):
+    match = _VIDEO_ID.search(url or '')
+    return match.group(1) if match else None
+
+
+def watch_url(vid):
+    return f"https://www.youtube.com/watch?v={vid}"
+
+
+def playlist_id(url):
+    match = YOUTUBE_PLAYLIST_PATTERN.match(url or '')
+    return match.group(1) if match else None
+
+
+def _stream_expiry(url):
+    """When a signed stream URL stops working, less a margin so a track started from cache can finish"""
+    try:
+        expires = int(parse_qs(urlparse(url).query)['expire'][0])
+    except (KeyError, ValueError):
+        expires = time.time() + STREAM_TTL
+    return expires - STREAM_EXPIRY_MARGIN
+
+
+def stream_cache_room():
+    """Whether the stream cache has a free slot, after dropping expired entries if it is full"""
+    if len(_streams) >= STREAM_CACHE_SIZE:
+        now = time.time()
+        for expired in [v for v, (expires, _) in _streams.items() if expires <= now]:
+            del _streams[expired]
+    return len(_streams) < STREAM_CACHE_SIZE
+
+
+def _cache_stream(song, warm=False):
+    """Cache a resolved song; warmed songs only take free or expired slots and are evicted first"""
+    vid = video_id(song.get('webpage_url'))
+    if not vid or not song.get('url'):
+        return
+    if warm and vid not in _streams and not stream_cache_room():
+        return
+    _streams.pop(vid, None)
+    _streams[vid] = (_stream_expiry(song['url']), dict(song))
+    if warm:
+        _streams.move_to_end(vid, last=False)
+    while len(_streams) > STREAM_CACHE_SIZE:
+        _streams.popitem(last=False)
+
+
+def cached_stream(webpage_url, touch=True):
+    """A still-valid resolved song for this video, or None; touch marks it recently used"""
+    vid = video_id(webpage_url)
+    entry = _streams.get(vid) if vid else None
+    if not entry:
+        return None
+    if entry[0] <= time.time():
+        del _streams[vid]
+        return None
+    if touch:
+        _streams.move_to_end(vid)
+    return dict(entry[1])
+
+
+def extraction_idle():
+    """Nothing queued or running and the limiter has headroom; background warmers wait for this"""
+    return (
+        not PENDING_EXTRACTIONS.get() and _limiter.state == CLOSED
+        and _limiter.tokens >= _limiter.burst / 2
+    )
+
+
+def _is_rate_limited(error):
+    message = str(error).lower()
+    return any(marker in message for marker in RATE_LIMIT_MARKERS)
+
+
+def _hedge_delay(flat):
+    """Seconds to wait before hedging, from recent successful extractions of the same kind"""
+    samples = _latencies[flat]
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    ordered = sorted(samples)
+    return max(HEDGE_MIN_DELAY, ordered[min(len(ordered) - 1, int(len(ordered) * YTDL_HEDGE_PERCENTILE))])
+
+
+def _hedge_opts(opts):
+    return {**opts, 'extractor_args': {'youtube': {'player_client': [YTDL_HEDGE_CLIENT]}}}
+
+
+async def _hedged_extract(yt_query, ticket, opts):
+    """Run the extraction; if an interactive one is slow, race a second attempt and keep the first success.
+
+    The losing attempt is abandoned rather than stopped: its worker thread runs to
+    completion and the result is discarded.
+    """
+    primary = asyncio.ensure_future(asyncio.to_thread(_extract_info, yt_query, opts))
+    attempts = {primary}
+    try:
+        if ticket.background or not YTDL_HEDGE_PERCENTILE:
+            return await primary
+        done, _ = await asyncio.wait(attempts, timeout=_hedge_delay(bool(opts.get('extract_flat'))))
+        if done or ticket.background:
+            return await primary
+
+        await _limiter.acquire(Ticket())
+        if primary.done():
+            return await primary
+        HEDGED_EXTRACTIONS.inc()
+        with span('youtube.hedge'):
+            hedge = asyncio.ensure_future(asyncio.to_thread(_extract_info, yt_query, _hedge_opts(opts)))
+            attempts.add(hedge)
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        HEDGE_WINS.inc(winner='hedge' if attempt is hedge else 'primary')
+                        return attempt.result()
+            return primary.result()
+    finally:
+        for attempt in attempts:
+            if not attempt.done():
+                attempt.cancel()
+
+
+async def _run_extraction(yt_query, ticket, opts=YDL_OPTS):
+    PENDING_EXTRACTIONS.inc()
+    try:
+        with span('youtube.rate_limit', background=ticket.background):
+            await _limiter.acquire(ticket)
+
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            with span('youtube.extract', query=yt_query[:100]):
+                info = await asyncio.wait_for(
+                    _hedged_extract(yt_query, ticket, opts),
+                    timeout=EXTRACTION_TIMEOUT
+                )
+            outcome = 'ok'
+            _latencies[bool(opts.get('extract_flat'))].append(time.perf_counter() - start)
+            _limiter.record_success(ticket)
+            return info
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+            _limiter.record_failure(ticket)
+            raise Exception(f"Extraction timed out after {EXTRACTION_TIMEOUT}s")
+        except Exception as e:
+            if _is_rate_limited(e):
+                outcome = 'rate_limited'
+                RATE_LIMITED.inc()
+                _limiter.record_rate_limited(ticket)
+                print(f"⚠️ YouTube rate limiting detected, backing off background extraction ({_limiter.state})")
+            else:
+                _limiter.record_failure(ticket)
+            raise
+        finally:
+            EXTRACTION_SECONDS.observe(time.perf_counter() - start, outcome=outcome)
+    finally:
+        PENDING_EXTRACTIONS.dec()
+
+
+def _forget_inflight(key, task):
+    if key in _inflight and _inflight[key][0] is task:
+        del _inflight[key]
+    if not task.cancelled():
+        task.exception()
+
+
+async def _extract_with_timeout(yt_query, timeout=EXTRACTION_TIMEOUT, background=False, flat=False,
+                                playlist_end=None, playlist_start=1):
+    key = _coalesce_key(yt_query, flat, playlist_end, playlist_start)
+    if key in _inflight:
+        task, ticket = _inflight[key]
+        if not background:
+            ticket.promote()
+        EXTRACTIONS_COALESCED.inc()
+    else:
+        ticket = Ticket(background)
+        if playlist_end:
+            opts = {**YDL_PLAYLIST_OPTS, 'playliststart': playlist_start, 'playlistend': playlist_end}
+        else:
+            opts = YDL_FLAT_OPTS if flat else YDL_OPTS
+        task = asyncio.ensure_future(_run_extraction(yt_query, ticket, opts))
+        _inflight[key] = (task, ticket)
+        task.add_done_callback(lambda t, k=key: _forget_inflight(k, t))
+
     try:
-        return await asyncio.wait_for(
-            asyncio.to_thread(_extract_info, yt_query),
-            timeout=timeout
-        )
+        return await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
     except asyncio.TimeoutError:
-        raise Exception(f"Extraction timed out after {timeout}s")
+        raise Exception(f"Timed out waiting for extraction after {timeout}s")
 
 
 def _get_best_audio_url(info):
@@ -55,12 +326,21 @@ def _get_best_audio_url(info):
     return fallback
 
 
-async def refresh_url(webpage_url):
-    """Re-extract URL from webpage_url (for expired streams)"""
+async def refresh_url(webpage_url, background=False):
+    """Re-extract URL from webpage_url (for expired streams and lazily loaded tracks)"""
     try:
-        info = await _extract_with_timeout(webpage_url)
-        url = _get_best_audio_url(info)
+        with span('youtube.refresh_url'):
+            info = await _extract_with_timeout(webpage_url, background=background)
+            url = _get_best_audio_url(info)
         if url:
+            if info.get('title'):
+                _cache_stream({
+                    'url': url,
+                    'title': info['title'],
+                    'webpage_url': info.get('webpage_url', webpage_url),
+                    'duration': info.get('duration'),
+                    'thumbnail': info.get('thumbnail'),
+                })
             return url
     except Exception as e:
         print(f"Error refreshing URL: {e}")
@@ -68,31 +348,56 @@ async def refresh_url(webpage_url):
 
 
 async def search_youtube(query, max_results=5):
+    """Search results for the picker; flat, so nothing is resolved until a track is chosen"""
     try:
-        info = await _extract_with_timeout(f'ytsearch{max_results}:{query}')
+        info = await _extract_with_timeout(f'ytsearch{max_results}:{query}', flat=True)
         if 'entries' not in info:
             return []
         results = []
         for entry in info['entries']:
-            if not entry:
-                continue
-            results.append({
-                'title': entry.get('title', 'Unknown'),
-                'webpage_url': entry.get('webpage_url', ''),
-                'duration': entry.get('duration'),
-                'thumbnail': entry.get('thumbnail'),
-                'channel': entry.get('channel', ''),
-            })
+            if entry and _entry_url(entry):
+                results.append(_flat_entry(entry))
         return results
     except Exception as e:
         print(f"Error searching YouTube: {e}")
         return []
 
 
+def _flat_entry(entry):
+    thumbnails = entry.get('thumbnails') or [{}]
+    return {
+        'title': entry.get('title', 'Unknown'),
+        'webpage_url': _entry_url(entry),
+        'duration': entry.get('duration'),
+        'thumbnail': entry.get('thumbnail') or thumbnails[-1].get('url'),
+        'channel': entry.get('channel', ''),
+    }
+
+
+async def get_youtube_playlist(url, limit, background=False, start=1):
+    """Playable entries at playlist indices start..limit, listed flat, and how many indices were listed.
+
+    The count includes private and deleted videos, so callers page on playlist
+    indices rather than on the filtered list. Stream URLs are resolved near playback.
+    """
+    try:
+        with span('youtube.playlist', start=start, limit=limit):
+            info = await _extract_with_timeout(url, background=background, playlist_end=limit, playlist_start=start)
+        entries = info.get('entries') or []
+        return [
+            _flat_entry(entry) for entry in entries
+            if entry and _entry_url(entry) and entry.get('title') not in ('[Private video]', '[Deleted video]')
+        ], len(entries)
+    except Exception as e:
+        print(f"Error fetching YouTube playlist {url}: {e}")
+        return [], 0
+
+
 async def resolve_youtube_entry(webpage_url):
     try:
-        info = await _extract_with_timeout(webpage_url)
-        url = _get_best_audio_url(info)
+        with span('youtube.resolve_entry'):
+            info = await _extract_with_timeout(webpage_url)
+            url = _get_best_audio_url(info)
         if not url:
             return None
         return {
@@ -107,48 +412,169 @@ async def resolve_youtube_entry(webpage_url):
         return None
 
 
-async def get_youtube_url(search_query):
-    yt_query = (
-        f'ytsearch:{search_query}'
-        if not search_query.startswith(('http://', 'https://'))
-        else search_query
+def _tokens(text):
+    return set(re.findall(r'\w+', text.lower()))
+
+
+def _score_candidate(entry, query, duration=None):
+    """Rank a flat search result against the wanted track without extracting it"""
+    title = (entry.get('title') or '').lower()
+    channel = (entry.get('channel') or entry.get('uploader') or '').lower()
+    query_lower = query.lower()
+    query_tokens = _tokens(query)
+    score = 0.0
+
+    if query_tokens:
+        score += 3 * len(query_tokens & _tokens(f'{title} {channel}')) / len(query_tokens)
+
+    length = entry.get('duration')
+    if duration and length:
+        diff = abs(length - duration)
+        if diff <= 3:
+            score += 3
+        elif diff <= 10:
+            score += 2
+        elif diff <= 30:
+            score += 0.5
+        else:
+            score -= min(4, diff / 30)
+
+    if 'topic' in channel:
+        score += 1.5
+    elif 'vevo' in channel:
+        score += 1
+    if 'official audio' in title or 'lyric' in title:
+        score += 1
+    elif 'audio' in title:
+        score += 0.5
+
+    for term in _NOISE_TERMS:
+        pattern = rf'\b{re.escape(term)}\b'
+        if re.search(pattern, title) and not re.search(pattern, query_lower):
+            score -= 3
+    return score
+
+
+def _entry_url(entry):
+    url = entry.get('webpage_url') or entry.get('url') or ''
+    if url.startswith(('http://', 'https://')):
+        return url
+    return f"https://www.youtube.com/watch?v={entry['id']}" if entry.get('id') else None
+
+
+async def _search_candidates(search_query, duration=None, background=False):
+    info = await _extract_with_timeout(
+        f'ytsearch{SEARCH_CANDIDATES}:{search_query}', background=background, flat=True
     )
+    entries = [e for e in info.get('entries') or [] if e and _entry_url(e)]
+    return sorted(entries, key=lambda e: _score_candidate(e, search_query, duration), reverse=True)
+
 
+def _is_cacheable_failure(error):
+    """Failures that say the track itself can't be played, not that YouTube or the network hiccuped"""
+    message = str(error).lower()
+    return not _is_rate_limited(error) and any(marker in message for marker in PERMANENT_FAILURE_MARKERS)
+
+
+def _remember_failure(key, error):
     try:
-        info = await _extract_with_timeout(yt_query)
+        ttl = record_failed_lookup(key, str(error), NEGATIVE_CACHE_TTL, NEGATIVE_CACHE_MAX_TTL)
+        _failed.add(key)
+        print(f"🚫 Skipping {key[:80]} for {ttl // 60}m: {str(error)[:100]}")
+    except Exception as e:
+        print(f"Error recording failed lookup: {e}")
 
-        if 'entries' in info:
-            entries = info['entries']
-
-            for entry in entries[:5]:
-                if entry:
-                    title_lower = entry.get('title', '').lower()
-                    channel_lower = entry.get('channel', '').lower()
-
-                    if (
-                        any(k in title_lower for k in [
-                            'official audio', 'audio', 'lyric'])
-                        or 'topic' in channel_lower
-                        or 'vevo' in channel_lower
-                    ):
-                        info = entry
+
+async def get_youtube_url(search_query, background=False, duration=None, warm=False):
+    """Resolve a URL or search to a playable stream; searches pick the best of a flat result list.
+
+    warm marks a speculative lookup whose result must not displace streams in use.
+    """
+    is_url = search_query.startswith(('http://', 'https://'))
+    key = _coalesce_key(search_query)
+    try:
+        failure = get_failed_lookup(key)
+        if failure:
+            # A URL someone just typed is always retried; the cache spares background and Spotify lookups
+            if not failure[1] and (background or not is_url):
+                NEGATIVE_CACHE_HITS.inc()
+                return None
+            _failed.add(key)
+    except Exception as e:
+        print(f"Error reading failed lookups: {e}")
+
+    try:
+        resolved = search_query if is_url else get_resolved_lookup(key, RESOLVE_CACHE_DAYS)
+    except Exception as e:
+        print(f"Error reading resolved lookups: {e}")
+        resolved = None
+    if resolved:
+        song = cached_stream(resolved)
+        if song:
+            STREAM_CACHE_HITS.inc()
+            return song
+
+    # Failing candidates only say those videos are unplayable, not that the search is
+    cacheable = True
+    try:
+        with span('youtube.get_youtube_url', query=search_query[:100]):
+            info = None
+            if resolved and not is_url:
+                # Skip the search for a query we have resolved before, unless that video stopped working
+                try:
+                    target = resolved
+                    info = await _extract_with_timeout(target, background=background)
+                except Exception:
+                    resolved = None
+
+            if info is None:
+                if is_url:
+                    targets = [search_query]
+                else:
+                    with span('youtube.rank_candidates'):
+                        candidates = await _search_candidates(search_query, duration, background)
+                    targets = [_entry_url(e) for e in candidates[:2]]
+                if not targets:
+                    raise ValueError("No search results")
+                cacheable = is_url
+
+                for i, target in enumerate(targets):
+                    try:
+                        info = await _extract_with_timeout(target, background=background)
                         break
-            else:
-                info = entries[0]
+                    except Exception:
+                        if i == len(targets) - 1:
+                            raise
 
-        url = _get_best_audio_url(info)
+        if 'entries' in info:
+            info = next(e for e in info['entries'] if e)
+
+        with span('youtube.best_audio_url'):
+            url = _get_best_audio_url(info)
 
         if not url:
             raise ValueError("No valid stream URL found")
 
-        return {
+        if key in _failed:
+            _failed.discard(key)
+            clear_failed_lookup(key)
+        song = {
             'url': url,
             'title': info['title'],
-            'webpage_url': info.get('webpage_url', yt_query),
+            'webpage_url': info.get('webpage_url', target),
             'duration': info.get('duration'),
             'thumbnail': info.get('thumbnail'),
         }
+        _cache_stream(song, warm)
+        if not is_url and song['webpage_url'] != resolved:
+            try:
+                set_resolved_lookup(key, song['webpage_url'])
+            except Exception as e:
+                print(f"Error recording resolved lookup: {e}")
+        return song
 
     except Exception as e:
         print(f"Error searching YouTube: {e}")
+        if cacheable and _is_cacheable_failure(e):
+            _remember_failure(key, e)
         return None
@@ -4,6 +4,18 @@ import subprocess
 import shutil
 import os
 from utils.config import FFMPEG_PATH, MAX_FILE_SIZE
+from utils.metrics import Gauge
+from utils.tracing import span
+
+FFMPEG_JOBS = Gauge('ffmpeg_clip_jobs', 'Running ffmpeg clip and download conversions')
+
+
+def _run_ffmpeg(cmd):
+    FFMPEG_JOBS.inc()
+    try:
+        subprocess.run(cmd, check=True, stderr=subprocess.PIPE)
+    finally:
+        FFMPEG_JOBS.dec()
 
 
 async def create_clip(url, start_sec, end_sec, format="mp3"):
@@ -23,7 +35,8 @@ async def create_clip(url, start_sec, end_sec, format="mp3"):
         ]
 
         loop = asyncio.get_running_loop()
-        await loop.run_in_executor(None, lambda: subprocess.run(cmd, check=True, stderr=subprocess.PIPE))
+        with span('audio.clip_ffmpeg', seconds=end_sec - start_sec):
+            await loop.run_in_executor(None, _run_ffmpeg, cmd)
 
         if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
             if os.path.getsize(output_path) > MAX_FILE_SIZE:
@@ -49,7 +62,8 @@ async def download_audio(url, title, format="mp3"):
         ]
 
         loop = asyncio.get_running_loop()
-        await loop.run_in_executor(None, lambda: subprocess.run(cmd, check=True, stderr=subprocess.PIPE))
+        with span('audio.download_ffmpeg'):
+            await loop.run_in_executor(None, _run_ffmpeg, cmd)
 
         if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
             if os.path.getsize(output_path) > MAX_FILE_SIZE:
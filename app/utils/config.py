@@ -13,6 +13,7 @@ SPOTIFY_PATTERNS = {
     'playlist': re.compile(r'https://open\.spotify\.com/playlist/([a-zA-Z0-9]+)'),
     'album': re.compile(r'https://open\.spotify\.com/album/([a-zA-Z0-9]+)')
 }
+YOUTUBE_PLAYLIST_PATTERN = re.compile(r'https://(?:www\.|m\.|music\.)?youtube\.com/.*[?&]list=([A-Za-z0-9_-]+)')
 
 YDL_OPTS = {
     'format': 'bestaudio[ext=m4a]/bestaudio[protocol^=http]/bestaudio/best',
@@ -28,6 +29,21 @@ YDL_OPTS = {
     'prefer_free_formats': False,
 }
 
+# Flat extraction lists search results without resolving each video's formats
+YDL_FLAT_OPTS = {
+    **YDL_OPTS,
+    'extract_flat': 'in_playlist',
+}
+SEARCH_CANDIDATES = 5
+
+# Playlists are listed flat: the first page is queued at once, the rest in the background
+YDL_PLAYLIST_OPTS = {
+    **YDL_FLAT_OPTS,
+    'noplaylist': False,
+}
+YOUTUBE_PLAYLIST_PAGE = 100
+MAX_YOUTUBE_PLAYLIST_TRACKS = 500
+
 FFMPEG_OPTIONS = {
     'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
     'options': '-vn'
@@ -35,5 +51,43 @@ FFMPEG_OPTIONS = {
 
 MAX_QUEUE_DISPLAY = 10
 MAX_PLAYLIST_TRACKS = 100
+MAX_SAVED_PLAYLIST_TRACKS = 5000
 MAX_CLIP_LENGTH = 60
 MAX_FILE_SIZE = 8 * 1024 * 1024  # 8MB
+
+FORCE_COMMAND_SYNC = getenv("FORCE_COMMAND_SYNC", "") == "1"
+
+# Guilds playing the same stream share one ffmpeg Opus decoder. Radio semantics: a guild
+# starting a track another guild is already playing joins at the live position, and a
+# pause resumes where it stopped, trailing the live position (after more than 10s it
+# continues on a private ffmpeg). Repeats, seeks and resumed sessions always use a
+# private ffmpeg.
+AUDIO_FANOUT = getenv("AUDIO_FANOUT", "") == "1"
+
+SNAPSHOT_INTERVAL = int(getenv("SNAPSHOT_INTERVAL", "15"))
+
+METRICS_HOST = getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(getenv("METRICS_PORT", "9100"))  # 0 disables the endpoint
+
+LOOP_LAG_THRESHOLD_MS = int(getenv("LOOP_LAG_THRESHOLD_MS", "100"))
+
+YTDL_RATE = float(getenv("YTDL_RATE", "2"))  # extractions per second
+YTDL_BURST = int(getenv("YTDL_BURST", "10"))
+
+# Interactive extractions slower than this percentile of recent ones get a second
+# attempt with another player client; 0 disables hedging
+YTDL_HEDGE_PERCENTILE = float(getenv("YTDL_HEDGE_PERCENTILE", "0.95"))
+YTDL_HEDGE_CLIENT = getenv("YTDL_HEDGE_CLIENT", "mweb")
+
+# Pre-resolve each guild's most and recently played tracks when extraction is idle
+WARM_INTERVAL = int(getenv("WARM_INTERVAL", "600"))  # seconds between passes, 0 disables
+WARM_TRACKS = int(getenv("WARM_TRACKS", "10"))  # per guild, from each of top and recent
+WARM_ACTIVE_HOURS = int(getenv("WARM_ACTIVE_HOURS", "24"))  # only guilds in voice or with plays this recent
+WARM_MAX_PER_PASS = int(getenv("WARM_MAX_PER_PASS", "200"))  # extractions per pass across all guilds
+
+# Record anonymized command invocations for benchmarks/replay.py (empty disables)
+COMMAND_RECORD_PATH = getenv("COMMAND_RECORD_PATH", "")
+COMMAND_RECORD_SALT = getenv("COMMAND_RECORD_SALT", "")
+
+TRACE_SAMPLE_RATE = float(getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_PATH = getenv("TRACE_PATH", "/app/data/traces.jsonl")
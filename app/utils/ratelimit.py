@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+
+
+class Ticket:
+    """One caller's place in the limiter; can be promoted to interactive while waiting"""
+
+    def __init__(self, background=False):
+        self.background = background
+        self.probe = False
+        self.wake = asyncio.Event()
+
+    def promote(self):
+        if self.background:
+            self.background = False
+            self.wake.set()
+
+
+class AdaptiveLimiter:
+    """Token bucket with multiplicative backoff and a circuit breaker for background work.
+
+    Interactive callers may borrow up to ``burst`` tokens past empty, so they are
+    never queued behind background work; background callers repay that debt and
+    are held entirely while the breaker is open.
+    """
+
+    def __init__(self, rate, burst, min_rate=0.1, base_backoff=30, max_backoff=600):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        self._open_until = 0.0
+        self._backoff = 0
+        self._probing = False
+
+    @property
+    def state(self):
+        if self._open_until > time.monotonic():
+            return OPEN
+        if self._backoff:
+            return HALF_OPEN
+        return CLOSED
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _try_acquire(self, ticket):
+        """Take a token or return how long to wait before trying again"""
+        now = time.monotonic()
+        self._refill(now)
+        if not ticket.background:
+            if self.tokens > -self.burst:
+                self.tokens -= 1
+                return 0
+            return (1 - self.burst - self.tokens) / self.rate
+
+        state = self.state
+        if state == OPEN:
+            return self._open_until - now
+        if state == HALF_OPEN and self._probing:
+            return 1.0
+        if self.tokens >= 1:
+            self.tokens -= 1
+            if state == HALF_OPEN:
+                self._probing = True
+                ticket.probe = True
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self, ticket):
+        while True:
+            wait = self._try_acquire(ticket)
+            if wait <= 0:
+                return
+            ticket.wake.clear()
+            try:
+                await asyncio.wait_for(ticket.wake.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def record_success(self, ticket):
+        if ticket.probe or (self._backoff and self.state == HALF_OPEN and not ticket.background):
+            self._backoff = 0
+            self._probing = False
+        self.rate = min(self.base_rate, self.rate + self.base_rate * 0.05)
+
+    def record_failure(self, ticket):
+        if ticket.probe:
+            self._probing = False
+
+    def record_rate_limited(self, ticket):
+        self._probing = False
+        if self.state == OPEN:
+            return
+        self._backoff = min(self.max_backoff, self._backoff * 2 if self._backoff else self.base_backoff)
+        self._open_until = time.monotonic() + self._backoff
+        self.rate = max(self.min_rate, self.rate / 2)
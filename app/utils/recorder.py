@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import secrets
+import threading
+from utils.config import COMMAND_RECORD_PATH, COMMAND_RECORD_SALT, SPOTIFY_PATTERNS, YOUTUBE_PLAYLIST_PATTERN
+
+_lock = threading.Lock()
+_sink = None
+_salt = None
+# Positions (seek 1:30, cut 10 20) say nothing about the user and replay needs them verbatim
+PLAIN_PARAMS = {('seek', 'position'), ('cut', 'start'), ('cut', 'end')}
+
+
+def _get_salt():
+    """COMMAND_RECORD_SALT, or a random salt generated once and kept in the database"""
+    global _salt
+    if _salt is None:
+        _salt = COMMAND_RECORD_SALT
+        if not _salt:
+            from services.database import get_meta, set_meta
+            _salt = get_meta('command_record_salt')
+            if not _salt:
+                _salt = secrets.token_hex(16)
+                set_meta('command_record_salt', _salt)
+    return _salt
+
+
+def _hash(value):
+    return hashlib.blake2b(f'{_get_salt()}{value}'.encode(), digest_size=8).hexdigest()
+
+
+def _kind(text):
+    if not text.startswith(('http://', 'https://')):
+        return 'text'
+    for pattern_type, pattern in SPOTIFY_PATTERNS.items():
+        if pattern.match(text):
+            return f'spotify_{pattern_type}'
+    if YOUTUBE_PLAYLIST_PATTERN.match(text):
+        return 'youtube_playlist'
+    if 'youtube.com' in text or 'youtu.be' in text:
+        return 'youtube'
+    return 'url'
+
+
+def anonymize(value, plain=False):
+    """Numbers and plain parameters as-is; text, URLs and Discord objects as a salted hash plus their kind"""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        if plain:
+            return value
+        text = ' '.join(value.split())
+        kind = _kind(text)
+        # Equivalent searches share a hash, so replay reproduces cache and coalescing hits
+        return {'kind': kind, 'hash': _hash(text.lower() if kind == 'text' else text)}
+    return {'kind': 'id', 'hash': _hash(getattr(value, 'id', value))}
+
+
+def record_command(command, source, guild_id, user_id, params, created_at, seconds):
+    """Append one completed command invocation to COMMAND_RECORD_PATH.
+
+    created_at orders and spaces the replay; seconds is the time spent running
+    the command, measured the same way replay measures it.
+    """
+    if not COMMAND_RECORD_PATH:
+        return
+    line = json.dumps({
+        't': round(created_at, 3),
+        'ms': round(seconds * 1000, 1),
+        'command': command,
+        'source': source,
+        'guild': _hash(guild_id) if guild_id else None,
+        'user': _hash(user_id) if user_id else None,
+        'args': {name: anonymize(value, (command, name) in PLAIN_PARAMS) for name, value in params.items()},
+    }, separators=(',', ':')) + '\n'
+
+    global _sink
+    with _lock:
+        try:
+            if _sink is None:
+                os.makedirs(os.path.dirname(COMMAND_RECORD_PATH) or '.', exist_ok=True)
+                _sink = open(COMMAND_RECORD_PATH, 'a', buffering=1)
+            _sink.write(line)
+        except OSError as e:
+            print(f"Error writing command record: {e}")
@@ -0,0 +1,28 @@
+import time
+
+_started = time.perf_counter()
+_marks = []
+_reported = False
+
+
+def mark(stage, note=None):
+    """Record the end of a startup stage"""
+    if _reported:
+        return
+    _marks.append((stage, time.perf_counter(), note))
+
+
+def report():
+    global _reported
+    if _reported:
+        return
+    _reported = True
+    parts = []
+    previous = _started
+    for stage, at, note in _marks:
+        label = f"{stage} {at - previous:.2f}s"
+        if note:
+            label += f" ({note})"
+        parts.append(label)
+        previous = at
+    print(f"⏱️ Startup took {previous - _started:.2f}s: " + ' · '.join(parts))
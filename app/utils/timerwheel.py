@@ -0,0 +1,72 @@
+import asyncio
+import math
+
+
+class TimerWheel:
+    """Hashed timer wheel: O(1) arm/cancel for many coarse deadlines on one driver task.
+
+    Deadlines fire within one tick of their delay. The driver task only runs while
+    at least one timer is armed.
+    """
+
+    def __init__(self, tick=1.0, slots=512):
+        self.tick = tick
+        self.slots = slots
+        self._wheel = [{} for _ in range(slots)]
+        self._where = {}
+        self._cursor = 0
+        self._task = None
+        self._callbacks = set()
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def arm(self, key, delay, callback):
+        """Call callback (a function or coroutine function) after delay seconds, replacing any timer for key"""
+        self.cancel(key)
+        ticks = max(1, math.ceil(delay / self.tick))
+        slot = (self._cursor + ticks) % self.slots
+        self._wheel[slot][key] = [(ticks - 1) // self.slots, callback]
+        self._where[key] = slot
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def cancel(self, key):
+        slot = self._where.pop(key, None)
+        if slot is None:
+            return False
+        self._wheel[slot].pop(key, None)
+        return True
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time() + self.tick
+        while self._where:
+            await asyncio.sleep(max(0, next_tick - loop.time()))
+            next_tick += self.tick
+            self._advance()
+
+    def _advance(self):
+        self._cursor = (self._cursor + 1) % self.slots
+        bucket = self._wheel[self._cursor]
+        due = []
+        for key, entry in list(bucket.items()):
+            if entry[0]:
+                entry[0] -= 1
+                continue
+            del bucket[key]
+            del self._where[key]
+            due.append(entry[1])
+
+        for callback in due:
+            try:
+                result = callback()
+                if asyncio.iscoroutine(result):
+                    task = asyncio.ensure_future(result)
+                    self._callbacks.add(task)
+                    task.add_done_callback(self._callbacks.discard)
+            except Exception as e:
+                print(f"Timer callback error: {e}")
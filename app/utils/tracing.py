@@ -0,0 +1,98 @@
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from utils.config import TRACE_SAMPLE_RATE, TRACE_PATH
+
+_trace_id = contextvars.ContextVar('trace_id', default=None)
+_span_id = contextvars.ContextVar('span_id', default=None)
+_lock = threading.Lock()
+_sink = None
+
+
+def _write(record):
+    global _sink
+    line = json.dumps(record, separators=(',', ':'), default=str) + '\n'
+    with _lock:
+        try:
+            if _sink is None:
+                os.makedirs(os.path.dirname(TRACE_PATH) or '.', exist_ok=True)
+                _sink = open(TRACE_PATH, 'a', buffering=1)
+            _sink.write(line)
+        except OSError as e:
+            print(f"Error writing trace: {e}")
+
+
+def start_trace(trace_id=None):
+    """Begin a trace for the current task if sampled; returns the trace id or None"""
+    if not TRACE_SAMPLE_RATE or random.random() >= TRACE_SAMPLE_RATE:
+        _trace_id.set(None)
+        return None
+    trace_id = str(trace_id or uuid.uuid4().hex[:16])
+    _trace_id.set(trace_id)
+    _span_id.set(None)
+    return trace_id
+
+
+@contextmanager
+def use_trace(trace_id):
+    """Attach spans in this block to an existing trace (e.g. the one that queued a track)"""
+    token = _trace_id.set(trace_id)
+    parent = _span_id.set(None)
+    try:
+        yield
+    finally:
+        _span_id.reset(parent)
+        _trace_id.reset(token)
+
+
+@contextmanager
+def span(name, **attrs):
+    trace_id = _trace_id.get()
+    if trace_id is None:
+        yield attrs
+        return
+
+    span_id = uuid.uuid4().hex[:8]
+    parent = _span_id.set(span_id)
+    start = time.time()
+    began = time.perf_counter()
+    error = None
+    try:
+        yield attrs
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _span_id.reset(parent)
+        _write({
+            'trace': trace_id,
+            'span': span_id,
+            'parent': parent.old_value if parent.old_value is not contextvars.Token.MISSING else None,
+            'name': name,
+            'start': start,
+            'ms': (time.perf_counter() - began) * 1000,
+            'attrs': attrs,
+            'error': error,
+        })
+
+
+def record(name, seconds, trace_id=None, **attrs):
+    """Write a span whose timing was measured elsewhere (e.g. on the audio thread)"""
+    trace_id = trace_id or _trace_id.get()
+    if trace_id is None:
+        return
+    _write({
+        'trace': trace_id,
+        'span': uuid.uuid4().hex[:8],
+        'parent': None,
+        'name': name,
+        'start': time.time() - seconds,
+        'ms': seconds * 1000,
+        'attrs': attrs,
+        'error': None,
+    })
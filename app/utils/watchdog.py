@@ -0,0 +1,106 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from utils.config import LOOP_LAG_THRESHOLD_MS
+from utils.metrics import Counter, Histogram
+
+CHECK_INTERVAL = 0.1
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LOOP_LAG_SECONDS = Histogram(
+    'event_loop_lag_seconds', 'Delay between when the watchdog expected to run and when it ran',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+LOOP_STALLS = Counter('event_loop_stalls_total', 'Event loop stalls over the lag threshold, by call site')
+LOOP_STALL_SECONDS = Counter('event_loop_stall_seconds_total', 'Time the event loop was blocked, by call site')
+
+_offenders = {}
+_heartbeat = None
+_pending_stall = None
+_started = False
+
+
+def _frame_site(frame):
+    filename = os.path.abspath(frame.f_code.co_filename)
+    if filename.startswith(APP_DIR + os.sep):
+        module = os.path.splitext(os.path.relpath(filename, APP_DIR))[0].replace(os.sep, '.')
+    else:
+        module = os.path.splitext(os.path.basename(filename))[0]
+    name = getattr(frame.f_code, 'co_qualname', frame.f_code.co_name)
+    return f"{module}.{name}:{frame.f_lineno}"
+
+
+def _attribute(frame):
+    """Return (app call site, innermost frame) for a stack captured during a stall"""
+    leaf = _frame_site(frame)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(APP_DIR + os.sep) and filename != os.path.abspath(__file__):
+            return _frame_site(frame), leaf
+        frame = frame.f_back
+    return leaf, leaf
+
+
+def _monitor(loop_thread_id, threshold):
+    global _pending_stall
+    while True:
+        time.sleep(CHECK_INTERVAL / 2)
+        beat = _heartbeat
+        if beat is None or _pending_stall is not None:
+            continue
+        if time.monotonic() - beat > CHECK_INTERVAL + threshold:
+            frame = sys._current_frames().get(loop_thread_id)
+            if frame is not None:
+                _pending_stall = _attribute(frame)
+
+
+def _record_stall(lag):
+    global _pending_stall
+    site, leaf = _pending_stall or ('unknown', 'unknown')
+    _pending_stall = None
+
+    entry = _offenders.setdefault(site, {'count': 0, 'total': 0.0, 'max': 0.0, 'leaf': leaf})
+    entry['count'] += 1
+    entry['total'] += lag
+    if lag > entry['max']:
+        entry['max'] = lag
+        entry['leaf'] = leaf
+
+    LOOP_STALLS.inc(site=site)
+    LOOP_STALL_SECONDS.inc(lag, site=site)
+    print(f"🐢 Event loop blocked for {lag * 1000:.0f}ms in {site} (at {leaf})")
+
+
+async def _heartbeat_loop(threshold):
+    global _heartbeat, _pending_stall
+    while True:
+        _heartbeat = time.monotonic()
+        await asyncio.sleep(CHECK_INTERVAL)
+        lag = max(0.0, time.monotonic() - _heartbeat - CHECK_INTERVAL)
+        LOOP_LAG_SECONDS.observe(lag)
+        if lag > threshold:
+            _record_stall(lag)
+        else:
+            _pending_stall = None
+
+
+def start_watchdog():
+    """Start measuring loop lag and attributing stalls to the blocking call site"""
+    global _started
+    if _started:
+        return
+    _started = True
+    threshold = LOOP_LAG_THRESHOLD_MS / 1000
+    threading.Thread(
+        target=_monitor, args=(threading.get_ident(), threshold),
+        name='loop-watchdog', daemon=True
+    ).start()
+    asyncio.get_running_loop().create_task(_heartbeat_loop(threshold))
+
+
+def worst_offenders(limit=10):
+    rows = [{'site': site, **entry} for site, entry in _offenders.items()]
+    rows.sort(key=lambda r: r['total'], reverse=True)
+    return rows[:limit]
@@ -0,0 +1,206 @@
+"""Multi-guild load test for the player loop.
+
+Ramps the number of concurrently active guilds and, at each level, has every
+guild start a player and then issue a random mix of queue, skip, seek and stats
+commands against fake voice clients and stub media. Prints a scaling curve of
+CPU per stream, memory per guild, event-loop lag and error rate.
+
+    python benchmarks/loadtest.py --levels 100,250,500,1000 --duration 20
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stubs import Stubs, make_guild  # noqa: E402
+from run import _summary, _git_revision  # noqa: E402
+
+OPERATIONS = (('queue', 4), ('skip', 2), ('seek', 1), ('stats', 2))
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def _lag_sampler(samples, stop, interval=0.05):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - start - interval))
+
+
+async def _guild_worker(guild_id, voice_client, channel, rng, stop, counts, op_interval):
+    from services import music
+    from services.database import get_user_status, get_top_tracks, log_event
+    from services.youtube import get_youtube_url
+
+    names = [name for name, _ in OPERATIONS]
+    weights = [weight for _, weight in OPERATIONS]
+    serial = 0
+
+    while not stop.is_set():
+        await asyncio.sleep(rng.expovariate(1 / op_interval))
+        if stop.is_set():
+            break
+        op = rng.choices(names, weights)[0]
+        counts['ops'] += 1
+        try:
+            if op == 'queue':
+                serial += 1
+                song = await get_youtube_url(f'Load Artist {guild_id % 97} - Song {serial % 50}')
+                if not song:
+                    raise RuntimeError('resolution failed')
+                song['requested_by'] = guild_id
+                if voice_client.is_playing() or voice_client.is_paused():
+                    music.add_to_queue(guild_id, song)
+                else:
+                    await music.start_player(voice_client, song, guild_id, channel)
+            elif op == 'skip':
+                if voice_client.is_playing():
+                    voice_client.stop()
+                    log_event(guild_id, guild_id, 'skip')
+            elif op == 'seek':
+                if guild_id in music.current_tracks:
+                    if not await music.seek_track(voice_client, guild_id, rng.randint(1, 20)):
+                        raise RuntimeError('seek failed')
+            else:
+                get_user_status(guild_id, guild_id)
+                get_top_tracks(guild_id)
+        except Exception:
+            counts['errors'] += 1
+            counts['errors_' + op] = counts.get('errors_' + op, 0) + 1
+
+
+async def run_level(guilds, duration, op_interval, seed):
+    from services import music
+    from services.youtube import get_youtube_url
+
+    gc.collect()
+    rss_before = _rss_bytes()
+    counts = {'ops': 0, 'errors': 0, 'start_failures': 0}
+    stop = asyncio.Event()
+    lags = []
+    sampler = asyncio.create_task(_lag_sampler(lags, stop))
+
+    fixtures = [make_guild(100_000 + i) for i in range(guilds)]
+
+    async def start(guild, voice_client, channel):
+        song = await get_youtube_url(f'Load Artist {guild.id % 97} - Opening {guild.id % 20}')
+        if not song:
+            counts['start_failures'] += 1
+            return
+        song['requested_by'] = guild.id
+        await music.start_player(voice_client, song, guild.id, channel)
+
+    ramp_start = time.perf_counter()
+    await asyncio.gather(*[start(*f) for f in fixtures])
+    ramp_seconds = time.perf_counter() - ramp_start
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    frames_start = sum(vc.frames for _, vc, _ in fixtures)
+    workers = [
+        asyncio.create_task(_guild_worker(
+            g.id, vc, ch, random.Random(seed * 1_000_003 + g.id), stop, counts, op_interval
+        ))
+        for g, vc, ch in fixtures
+    ]
+    await asyncio.sleep(duration)
+    rss_during = _rss_bytes()
+    stop.set()
+    await asyncio.gather(*workers, sampler, return_exceptions=True)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    streamed = (sum(vc.frames for _, vc, _ in fixtures) - frames_start) * 0.02
+
+    for guild, voice_client, _ in fixtures:
+        music.clear_queue(guild.id)
+        voice_client.stop()
+    await asyncio.sleep(0.2)
+
+    expected_seconds = guilds * wall
+    return {
+        'guilds': guilds,
+        'ramp_seconds': ramp_seconds,
+        'cpu_percent': cpu / wall * 100,
+        'cpu_ms_per_stream_second': cpu / streamed * 1000 if streamed else None,
+        'realtime_ratio': streamed / expected_seconds if expected_seconds else 0,
+        'rss_mb': rss_during / 2 ** 20,
+        'rss_kb_per_guild': (rss_during - rss_before) / guilds / 1024,
+        'loop_lag_seconds': _summary(lags),
+        'ops': counts['ops'],
+        'ops_per_second': counts['ops'] / wall,
+        'error_rate': counts['errors'] / counts['ops'] if counts['ops'] else 0,
+        'errors': {k[len('errors_'):]: v for k, v in counts.items() if k.startswith('errors_')},
+        'start_failures': counts['start_failures'],
+    }
+
+
+def _print_curve(levels):
+    header = (f"{'guilds':>7} {'ramp s':>7} {'cpu %':>7} {'cpu ms/s':>9} {'realtime':>9} "
+              f"{'rss MB':>7} {'KB/guild':>9} {'lag p50ms':>9} {'lag p95ms':>9} {'lag maxms':>9} {'err %':>6}")
+    print(header)
+    print('-' * len(header))
+    for r in levels:
+        lag = r['loop_lag_seconds']
+        cpu_stream = r['cpu_ms_per_stream_second']
+        print(
+            f"{r['guilds']:>7} {r['ramp_seconds']:>7.2f} {r['cpu_percent']:>7.1f} "
+            f"{cpu_stream if cpu_stream is not None else float('nan'):>9.3f} {r['realtime_ratio']:>9.3f} "
+            f"{r['rss_mb']:>7.1f} {r['rss_kb_per_guild']:>9.1f} "
+            f"{lag.get('p50', 0) * 1000:>9.1f} {lag.get('p95', 0) * 1000:>9.1f} {lag.get('max', 0) * 1000:>9.1f} "
+            f"{r['error_rate'] * 100:>6.2f}"
+        )
+
+
+async def run_ramp(args):
+    levels = [int(n) for n in args.levels.split(',')]
+    results = []
+    with Stubs(
+        ydl_latency=args.ydl_latency, failure_rate=args.failure_rate,
+        track_seconds=args.track_seconds, ffmpeg_startup=args.ffmpeg_startup,
+    ) as stubs:
+        for guilds in levels:
+            print(f"▶ {guilds} guilds...", file=sys.stderr)
+            results.append(await run_level(guilds, args.duration, args.op_interval, args.seed))
+    return stubs.settings, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--levels', default='100,250,500,1000')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of steady load per level')
+    parser.add_argument('--op-interval', type=float, default=5, help='mean seconds between commands per guild')
+    parser.add_argument('--ydl-latency', type=float, default=0.2)
+    parser.add_argument('--failure-rate', type=float, default=0.02)
+    parser.add_argument('--track-seconds', type=float, default=60)
+    parser.add_argument('--ffmpeg-startup', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the scaling curve as JSON to this path')
+    args = parser.parse_args()
+
+    settings, levels = asyncio.run(run_ramp(args))
+    _print_curve(levels)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'revision': _git_revision(),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'settings': {**settings, 'duration': args.duration, 'op_interval': args.op_interval},
+                'levels': levels,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""Replay recorded command traffic against the stubs.
+
+Reads a COMMAND_RECORD_PATH log and invokes the same slash command callbacks in
+the same order and guilds, with the original spacing divided by --speed.
+Hashed arguments become synthetic queries and URLs of the same kind, so repeated
+searches, playlists and Spotify links exercise the same caches and coalescing.
+Search pickers are answered with the first result after --pick-delay seconds.
+Prints per-command latency next to what was recorded, plus error counts.
+
+    python benchmarks/replay.py commands.jsonl --speed 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stubs import Stubs, FakeGuild, FakeVoiceChannel, FakeTextChannel, FakeInteraction, FakeFollowup  # noqa: E402
+from run import _summary, _git_revision  # noqa: E402
+
+# Need a real ffmpeg and filesystem, which the stubs don't provide
+SKIPPED = {'cut', 'download'}
+
+
+def load(path):
+    with open(path) as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    return sorted(events, key=lambda e: e['t'])
+
+
+def synthesize(value):
+    """A stand-in argument of the same kind; the same hash always gives the same value"""
+    if not isinstance(value, dict):
+        return value
+    kind, digest = value['kind'], value['hash']
+    if kind in ('youtube', 'url'):
+        return f'https://www.youtube.com/watch?v={digest[:11]}'
+    if kind == 'youtube_playlist':
+        return f'https://www.youtube.com/playlist?list=PL{digest}'
+    if kind.startswith('spotify_'):
+        return f'https://open.spotify.com/{kind[len("spotify_"):]}/{digest}'
+    if kind == 'text':
+        return f'Replay Artist {digest[:3]} - Song {digest}'
+    return None
+
+
+class _PickingFollowup(FakeFollowup):
+    """Answers a search picker the way most users do: the top result, a moment later"""
+
+    def __init__(self, channel, pick_delay):
+        super().__init__(channel)
+        self.pick_delay = pick_delay
+
+    async def send(self, content=None, embed=None, view=None, **kwargs):
+        if view is not None and hasattr(view, 'choice'):
+            asyncio.get_running_loop().call_later(self.pick_delay, self._pick, view)
+        return await super().send(content, embed=embed, view=view, **kwargs)
+
+    @staticmethod
+    def _pick(view):
+        if not view.is_finished():
+            view.choice = 0
+            view.stop()
+
+
+class _Guilds:
+    """One fake guild per recorded guild hash, kept for the whole replay so voice and queue state carry over"""
+
+    def __init__(self, pick_delay):
+        self.pick_delay = pick_delay
+        self._guilds = {}
+        self._users = {}
+
+    def interaction(self, guild_hash, user_hash):
+        if guild_hash not in self._guilds:
+            guild = FakeGuild(300_000 + len(self._guilds))
+            self._guilds[guild_hash] = (guild, FakeVoiceChannel(guild), FakeTextChannel(guild.id))
+        user_id = self._users.setdefault(user_hash, 1 + len(self._users))
+        interaction = FakeInteraction(*self._guilds[guild_hash], user_id=user_id)
+        interaction.followup = _PickingFollowup(interaction.channel, self.pick_delay)
+        return interaction
+
+    def all(self):
+        return [guild for guild, _, _ in self._guilds.values()]
+
+
+async def replay(events, speed, pick_delay):
+    from discord.ext import commands
+    import discord
+    from services import music
+    from bot.commands import register_commands
+
+    bot = commands.Bot(command_prefix='!', intents=discord.Intents.none())
+    register_commands(bot)
+    guilds = _Guilds(pick_delay)
+    latencies = {}
+    recorded = {}
+    counts = {'events': 0, 'skipped': 0, 'errors': 0}
+    errors = {}
+
+    async def invoke(event, callback):
+        interaction = guilds.interaction(event['guild'], event['user'])
+        args = {name: synthesize(value) for name, value in event['args'].items()}
+        start = time.perf_counter()
+        try:
+            await callback(interaction, **args)
+        except Exception as e:
+            counts['errors'] += 1
+            key = f"{event['command']}: {type(e).__name__}"
+            errors[key] = errors.get(key, 0) + 1
+            return
+        latencies.setdefault(event['command'], []).append(time.perf_counter() - start)
+
+    tasks = []
+    began = time.perf_counter()
+    origin = events[0]['t'] if events else 0
+    for event in events:
+        command = bot.tree.get_command(event['command'])
+        if command is None or event['command'] in SKIPPED or not event['guild']:
+            counts['skipped'] += 1
+            continue
+        delay = began + (event['t'] - origin) / speed - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        counts['events'] += 1
+        recorded.setdefault(event['command'], []).append(event['ms'] / 1000)
+        tasks.append(asyncio.create_task(invoke(event, command.callback)))
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - began
+
+    for guild in guilds.all():
+        music.clear_queue(guild.id)
+        if guild.voice_client:
+            guild.voice_client.stop()
+    await asyncio.sleep(0.2)
+
+    return {
+        **counts,
+        'guilds': len(guilds.all()),
+        'wall_seconds': wall,
+        'errors_by_command': errors,
+        'commands': {
+            name: {'replayed': _summary(samples), 'recorded': _summary(recorded[name])}
+            for name, samples in sorted(latencies.items())
+        },
+    }
+
+
+def _print_report(result):
+    print(f"{result['events']} commands in {result['guilds']} guilds over {result['wall_seconds']:.1f}s "
+          f"({result['skipped']} skipped, {result['errors']} errors)")
+    header = f"{'command':<14} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} {'rec p50':>8} {'rec p95':>8}"
+    print(header)
+    print('-' * len(header))
+    for name, stats in result['commands'].items():
+        replayed, rec = stats['replayed'], stats['recorded']
+        print(f"{name:<14} {replayed['n']:>5} {replayed['p50'] * 1000:>8.1f} {replayed['p95'] * 1000:>8.1f} "
+              f"{rec['p50'] * 1000:>8.1f} {rec['p95'] * 1000:>8.1f}")
+    for key, n in sorted(result['errors_by_command'].items()):
+        print(f"  ✗ {key} ×{n}")
+
+
+async def run_replay(events, args):
+    with Stubs(
+        ydl_latency=args.ydl_latency, failure_rate=args.failure_rate,
+        track_seconds=args.track_seconds, ffmpeg_startup=args.ffmpeg_startup,
+        connect_delay=args.connect_delay,
+    ) as stubs:
+        return stubs.settings, await replay(events, args.speed, args.pick_delay)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='a log written with COMMAND_RECORD_PATH')
+    parser.add_argument('--speed', type=float, default=1, help='replay this many times faster than recorded')
+    parser.add_argument('--limit', type=int, help='replay only the first N commands')
+    parser.add_argument('--pick-delay', type=float, default=2, help='seconds before answering a search picker')
+    parser.add_argument('--ydl-latency', type=float, default=0.2)
+    parser.add_argument('--failure-rate', type=float, default=0.02)
+    parser.add_argument('--track-seconds', type=float, default=180)
+    parser.add_argument('--ffmpeg-startup', type=float, default=0.1)
+    parser.add_argument('--connect-delay', type=float, default=0.1)
+    parser.add_argument('--output', help='write the report as JSON to this path')
+    args = parser.parse_args()
+
+    settings, result = asyncio.run(run_replay(load(args.path)[:args.limit], args))
+    _print_report(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'revision': _git_revision(),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'settings': {**settings, 'speed': args.speed, 'pick_delay': args.pick_delay, 'source': os.path.basename(args.path)},
+                'result': result,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+"""Offline performance benchmarks for the play path.
+
+Runs the real service code against the stand-ins in ``benchmarks/stubs.py``, so
+results depend only on the code under test and the configured stub latencies.
+
+    python benchmarks/run.py --output bench.json
+    python benchmarks/run.py --compare bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stubs import Stubs, FakeAudioSource, make_guild, make_interaction, ydl_config  # noqa: E402
+
+
+def _summary(samples):
+    if not samples:
+        return {'n': 0}
+    ordered = sorted(samples)
+    return {
+        'n': len(ordered),
+        'mean': statistics.fmean(ordered),
+        'p50': ordered[len(ordered) // 2],
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'max': ordered[-1],
+    }
+
+
+async def _wait_idle(guild_id, timeout=60):
+    from services import music
+    deadline = time.perf_counter() + timeout
+    while guild_id in music._player_tasks and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+
+
+async def bench_play_latency(runs):
+    """Search resolution plus player start until the first audio frame is consumed"""
+    from services import music
+    from services.youtube import get_youtube_url
+
+    samples = []
+    failed = 0
+    for i in range(runs):
+        guild_id = 10_000 + i
+        _, voice_client, channel = make_guild(guild_id)
+        start = time.perf_counter()
+        song = await get_youtube_url(f'Benchmark Artist - Play Latency {i}')
+        if not song:
+            failed += 1
+            continue
+        song['requested_by'] = 1
+        await music.start_player(voice_client, song, guild_id, channel, requested_at=start)
+        while not voice_client.first_frame_times:
+            await asyncio.sleep(0.001)
+        samples.append(voice_client.first_frame_times[0] - start)
+        music.clear_queue(guild_id)
+        voice_client.stop()
+    return {**_summary(samples), 'failed': failed}
+
+
+async def bench_play_command(runs):
+    """The /play command from a disconnected guild until the first audio frame"""
+    from discord.ext import commands
+    import discord
+    from services import music
+    from bot.commands import register_commands
+
+    bot = commands.Bot(command_prefix='!', intents=discord.Intents.none())
+    register_commands(bot)
+    play = bot.tree.get_command('play').callback
+
+    samples = []
+    for i in range(runs):
+        guild, interaction = make_interaction(15_000 + i)
+        start = time.perf_counter()
+        await play(interaction, f'https://www.youtube.com/watch?v=cmd{i:08d}')
+        voice_client = guild.voice_client
+        if not voice_client:
+            continue
+        deadline = start + 10
+        while not voice_client.first_frame_times and time.perf_counter() < deadline:
+            await asyncio.sleep(0.001)
+        if voice_client.first_frame_times:
+            samples.append(voice_client.first_frame_times[0] - start)
+        music.clear_queue(guild.id)
+        voice_client.stop()
+    return {**_summary(samples), 'failed': runs - len(samples)}
+
+
+async def bench_playlist_ingestion(size):
+    """Spotify playlist fetch plus background resolution of every track into the queue"""
+    from services import music
+    from services.spotify import get_spotify_playlist, process_spotify_tracks
+
+    guild_id = 20_000
+    _, _, channel = make_guild(guild_id)
+    start = time.perf_counter()
+    tracks = await get_spotify_playlist(f'bench-{size}')
+    fetched = time.perf_counter()
+    await process_spotify_tracks(tracks, guild_id, channel, user_id=1)
+    done = time.perf_counter()
+    queued = len(music.queues.get(guild_id, []))
+    music.clear_queue(guild_id)
+    return {
+        'tracks': len(tracks),
+        'queued': queued,
+        'fetch_seconds': fetched - start,
+        'resolve_seconds': done - fetched,
+        'tracks_per_second': queued / (done - start) if done > start else 0,
+    }
+
+
+async def bench_transition_gaps(tracks):
+    """Silence between consecutive queued tracks as seen by the voice client"""
+    from services import music
+    from services.youtube import get_youtube_url
+
+    guild_id = 30_000
+    _, voice_client, channel = make_guild(guild_id)
+    songs = [await get_youtube_url(f'Benchmark Artist - Transition {i}') for i in range(tracks)]
+    songs = [song for song in songs if song]
+    for song in songs[1:]:
+        music.add_to_queue(guild_id, song)
+    await music.start_player(voice_client, songs[0], guild_id, channel)
+    await _wait_idle(guild_id)
+    music.clear_queue(guild_id)
+
+    ends = voice_client.last_frame_times
+    starts = voice_client.first_frame_times
+    return _summary([s - e for e, s in zip(ends, starts[1:])])
+
+
+async def bench_fanout(guilds):
+    """ffmpeg processes and frames for many guilds starting the same stream with AUDIO_FANOUT on"""
+    from services import music, fanout
+    from services.youtube import get_youtube_url
+
+    song = await get_youtube_url('https://www.youtube.com/watch?v=fanout00001')
+    if not song:
+        return {'guilds': guilds, 'failed': guilds}
+    # Long enough for a paused guild to fall out of a 1s buffer and still have audio left
+    song = {**song, 'url': song['url'].replace(f'dur={ydl_config.track_seconds}', 'dur=3')}
+    voice_clients = [make_guild(50_000 + i) for i in range(guilds)]
+    spawned = FakeAudioSource.spawned
+    enabled, music.AUDIO_FANOUT = music.AUDIO_FANOUT, True
+    buffer_frames, fanout.BUFFER_FRAMES = fanout.BUFFER_FRAMES, 50
+    try:
+        for i, (_, voice_client, channel) in enumerate(voice_clients):
+            await music.start_player(voice_client, {**song, 'requested_by': 1}, 50_000 + i, channel)
+        await asyncio.sleep(0.2)
+        decoders = len(fanout._decoders)
+        # One guild pauses past the buffer, so it falls back to its own ffmpeg
+        paused = voice_clients[-1][1]
+        paused.pause()
+        await asyncio.sleep(fanout.BUFFER_FRAMES * fanout.FRAME_SECONDS + 0.5)
+        paused.resume()
+        for i in range(guilds):
+            await _wait_idle(50_000 + i)
+    finally:
+        music.AUDIO_FANOUT = enabled
+        fanout.BUFFER_FRAMES = buffer_frames
+    return {
+        'guilds': guilds,
+        'sources_spawned': FakeAudioSource.spawned - spawned,
+        'decoders': decoders,
+        'frames_delivered': sum(voice_client.frames for _, voice_client, _ in voice_clients),
+    }
+
+
+async def bench_db_logging(writes):
+    """Cost of log_play and log_event on the event loop"""
+    from services.database import log_play, log_event
+
+    samples = []
+    for i in range(writes):
+        start = time.perf_counter()
+        if i % 4:
+            log_play(40_000, i % 50, f'Artist {i % 37} - Song {i % 200}', f'https://www.youtube.com/watch?v={i:011d}')
+        else:
+            log_event(40_000, i % 50, 'skip', f'Artist {i % 37} - Song {i % 200}')
+        samples.append(time.perf_counter() - start)
+    return _summary(samples)
+
+
+async def run_all(args):
+    with Stubs(
+        ydl_latency=args.ydl_latency, failure_rate=args.failure_rate,
+        track_seconds=args.track_seconds, ffmpeg_startup=args.ffmpeg_startup,
+        connect_delay=args.connect_delay,
+    ) as stubs:
+        results = {
+            'play_to_audio_seconds': await bench_play_latency(args.runs),
+            'play_command_seconds': await bench_play_command(args.runs),
+            'playlist_ingestion': await bench_playlist_ingestion(args.playlist_size),
+            'transition_gap_seconds': await bench_transition_gaps(args.transitions),
+            'db_write_seconds': await bench_db_logging(args.db_writes),
+            'fanout': await bench_fanout(args.fanout_guilds),
+            'extractions': ydl_config.calls,
+        }
+    return stubs.settings, results
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def _flatten(data, prefix=''):
+    flat = {}
+    for key, value in data.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + '.'))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def _print_results(results, baseline=None):
+    current = _flatten(results)
+    previous = _flatten(baseline) if baseline else {}
+    width = max(len(k) for k in current)
+    for key, value in current.items():
+        line = f'{key:<{width}}  {value:>12.6g}'
+        if key in previous and previous[key]:
+            change = (value - previous[key]) / previous[key] * 100
+            line += f'  ({previous[key]:.6g} → {change:+.1f}%)'
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--playlist-size', type=int, default=100)
+    parser.add_argument('--transitions', type=int, default=10)
+    parser.add_argument('--db-writes', type=int, default=2000)
+    parser.add_argument('--fanout-guilds', type=int, default=20)
+    parser.add_argument('--ydl-latency', type=float, default=0.05)
+    parser.add_argument('--failure-rate', type=float, default=0.05)
+    parser.add_argument('--track-seconds', type=float, default=0.5)
+    parser.add_argument('--ffmpeg-startup', type=float, default=0.05)
+    parser.add_argument('--connect-delay', type=float, default=0.1)
+    parser.add_argument('--output', help='write results as JSON to this path')
+    parser.add_argument('--compare', help='baseline JSON from an earlier run')
+    args = parser.parse_args()
+
+    settings, results = asyncio.run(run_all(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            report = json.load(f)
+        baseline = report['results']
+        print(f"Comparing against {report.get('revision') or 'baseline'}")
+    _print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'revision': _git_revision(),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'settings': settings,
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
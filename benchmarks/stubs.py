@@ -0,0 +1,452 @@
+"""Deterministic local stand-ins for yt-dlp, Spotify, ffmpeg and Discord voice.
+
+Importing this module puts ``app/`` on ``sys.path`` and points ``DB_PATH`` at a
+throwaway database, so it must be imported before any ``services`` module.
+"""
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import parse_qs, urlparse
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app')
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+os.environ.setdefault('DB_PATH', os.path.join(tempfile.mkdtemp(prefix='bench-'), 'history.db'))
+os.environ.setdefault('METRICS_PORT', '0')
+
+FRAME_SECONDS = 0.02
+FRAME_SIZE = 3840  # 20ms of 48kHz stereo s16le PCM
+SILENCE = b'\x00' * FRAME_SIZE
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _fraction(text):
+    """Stable pseudo-random number in [0, 1) derived from text"""
+    return int(_digest(text)[:8], 16) / 0x100000000
+
+
+def video_id(text):
+    return _digest(text)[:11]
+
+
+class FakeExtractionError(Exception):
+    pass
+
+
+class FakeYDLConfig:
+    def __init__(self, latency=0.05, failure_rate=0.0, track_seconds=1.0, results_per_search=5,
+                 slow_rate=0.0, slow_latency=2.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.track_seconds = track_seconds
+        self.results_per_search = results_per_search
+        self.calls = 0
+
+
+ydl_config = FakeYDLConfig()
+
+
+def _video_info(vid, title, flat=False):
+    webpage_url = f'https://www.youtube.com/watch?v={vid}'
+    info = {
+        'id': vid,
+        'title': title,
+        'webpage_url': webpage_url,
+        'url': webpage_url,
+        'duration': ydl_config.track_seconds,
+        'channel': f'{title.split(" - ")[0]} - Topic',
+        'thumbnail': f'https://i.ytimg.com/vi/{vid}/hqdefault.jpg',
+    }
+    if flat:
+        info['_type'] = 'url'
+        return info
+    stream = f'https://fake.googlevideo.com/videoplayback?id={vid}&dur={ydl_config.track_seconds}'
+    info['formats'] = [
+        {'format_id': '140', 'acodec': 'mp4a.40.2', 'abr': 128, 'protocol': 'https', 'url': stream},
+        {'format_id': '251', 'acodec': 'opus', 'abr': 160, 'protocol': 'https', 'url': stream + '&itag=251'},
+    ]
+    info['url'] = stream
+    return info
+
+
+class FakeYoutubeDL:
+    """Drop-in for yt_dlp.YoutubeDL with configurable latency and failure rate"""
+
+    def __init__(self, params=None):
+        self.params = params or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, query, download=False):
+        ydl_config.calls += 1
+        # A slow edge or client variant: deterministic per query and player client
+        client = str(self.params.get('extractor_args', {}).get('youtube', {}).get('player_client'))
+        slow = _fraction(f'slow:{client}:{query}') < ydl_config.slow_rate
+        time.sleep(ydl_config.slow_latency if slow else ydl_config.latency)
+        if _fraction('fail:' + query) < ydl_config.failure_rate:
+            raise FakeExtractionError(f'ERROR: [youtube] {query}: Video unavailable')
+
+        flat = bool(self.params.get('extract_flat'))
+        if query.startswith('ytsearch'):
+            prefix, _, terms = query.partition(':')
+            count = int(prefix[len('ytsearch'):] or 1)
+            entries = [
+                _video_info(video_id(f'{terms}#{i}'), terms if i == 0 else f'{terms} (version {i})', flat)
+                for i in range(min(count, ydl_config.results_per_search))
+            ]
+            return {'_type': 'playlist', 'entries': entries}
+
+        params = parse_qs(urlparse(query).query)
+        if 'list' in params and not self.params.get('noplaylist', True):
+            # Playlist ids ending in -N have N entries, like the fake Spotify collections
+            list_id = params['list'][0]
+            size = FakeSpotify._size(list_id)
+            start = self.params.get('playliststart') or 1
+            end = min(size, self.params.get('playlistend') or size)
+            time.sleep(ydl_config.latency * (end // 100))  # one more page request per 100 entries
+            entries = [
+                _video_info(video_id(f'{list_id}#{i}'), f'Playlist {list_id} - Track {i}', flat)
+                for i in range(start - 1, end)
+            ]
+            return {'_type': 'playlist', 'id': list_id, 'entries': entries}
+
+        vid = params.get('v', [video_id(query)])[0]
+        return _video_info(vid, f'Video {vid}', flat)
+
+
+class FakeYDLModule:
+    YoutubeDL = FakeYoutubeDL
+
+
+class FakeSpotify:
+    """Drop-in for spotipy.Spotify serving deterministic paginated collections"""
+
+    def __init__(self, latency=0.02, page_latency=0.05):
+        self.latency = latency
+        self.page_latency = page_latency
+
+    def _track(self, key, i):
+        return {
+            'name': f'Song {key} {i}',
+            'artists': [{'name': f'Artist {i % 37}'}],
+            'duration_ms': int(ydl_config.track_seconds * 1000),
+            'album': {'images': [{'url': f'https://i.scdn.co/image/{key}{i}'}]},
+        }
+
+    def _page(self, key, total, limit, offset, wrap):
+        time.sleep(self.page_latency)
+        items = [self._track(key, i) for i in range(offset, min(offset + limit, total))]
+        if wrap:
+            items = [{'track': t} for t in items]
+        more = offset + limit < total
+        return {
+            'items': items,
+            'next': f'fake://{key}/{total}/{limit}/{offset + limit}/{int(wrap)}' if more else None,
+        }
+
+    @staticmethod
+    def _size(collection_id):
+        _, _, size = collection_id.rpartition('-')
+        return int(size) if size.isdigit() else 50
+
+    def track(self, track_id, market=None):
+        time.sleep(self.latency)
+        return self._track(track_id, 0)
+
+    def playlist_items(self, playlist_id, limit=100, offset=0, market=None):
+        return self._page(playlist_id, self._size(playlist_id), limit, offset, True)
+
+    def album_tracks(self, album_id, limit=50, market=None):
+        return self._page(album_id, self._size(album_id), limit, 0, False)
+
+    def next(self, results):
+        key, total, limit, offset, wrap = results['next'][len('fake://'):].split('/')
+        return self._page(key, int(total), int(limit), int(offset), bool(int(wrap)))
+
+
+class FakeAudioSource:
+    """Stands in for discord.FFmpegPCMAudio, producing silence for the track's duration"""
+
+    startup_delay = 0.05
+    spawned = 0  # every instance is one ffmpeg process in production
+
+    def __init__(self, url, *args, **kwargs):
+        FakeAudioSource.spawned += 1
+        params = parse_qs(urlparse(url).query)
+        duration = float(params.get('dur', [ydl_config.track_seconds])[0])
+        before = kwargs.get('before_options') or ''
+        offset = 0.0
+        if '-ss ' in before:
+            offset = float(before.split('-ss ')[1].split()[0])
+        self.remaining = max(0, int((duration - offset) / FRAME_SECONDS))
+        self.closed = False
+        self.ready_at = time.perf_counter() + self.startup_delay
+
+    def read(self):
+        if self.closed or self.remaining <= 0:
+            return b''
+        self.remaining -= 1
+        return SILENCE
+
+    def is_opus(self):
+        return False
+
+    def cleanup(self):
+        self.closed = True
+
+
+class FakeOpusAudio(FakeAudioSource):
+    """Stands in for discord.FFmpegOpusAudio"""
+
+    def is_opus(self):
+        return True
+
+
+class FakeMessage:
+    _ids = 0
+
+    def __init__(self, channel, content=None, embed=None, view=None):
+        FakeMessage._ids += 1
+        self.id = FakeMessage._ids
+        self.channel = channel
+        self.content = content
+        self.embed = embed
+        self.view = view
+
+    async def edit(self, **kwargs):
+        self.channel.edits += 1
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+        return self
+
+    async def delete(self, **kwargs):
+        pass
+
+    async def add_reaction(self, emoji):
+        pass
+
+
+class FakeTextChannel:
+    def __init__(self, channel_id=1):
+        self.id = channel_id
+        self.sent = 0
+        self.edits = 0
+
+    async def send(self, content=None, embed=None, view=None, file=None, delete_after=None, **kwargs):
+        self.sent += 1
+        return FakeMessage(self, content, embed, view)
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.voice_client = None
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild, channel_id=None):
+        self.guild = guild
+        self.id = channel_id or guild.id
+        self.members = []
+
+    async def connect(self, **kwargs):
+        await asyncio.sleep(FakeVoiceClient.connect_delay)
+        self.guild.voice_client = FakeVoiceClient(self)
+        return self.guild.voice_client
+
+
+class FakeVoiceClient:
+    """Consumes frames from the playing source in real time, like discord's AudioPlayer"""
+
+    connect_delay = 0.05
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.guild = channel.guild
+        self._connected = True
+        self._source = None
+        self._after = None
+        self._task = None
+        self._paused = False
+        self.frames = 0
+        self.first_frame_times = []
+        self.last_frame_times = []
+
+    def is_connected(self):
+        return self._connected
+
+    def is_playing(self):
+        return self._task is not None and not self._task.done() and not self._paused
+
+    def is_paused(self):
+        return self._task is not None and not self._task.done() and self._paused
+
+    def play(self, source, after=None):
+        if self._task and not self._task.done():
+            raise RuntimeError('Already playing audio.')
+        self._source = source
+        self._after = after
+        self._paused = False
+        self._task = asyncio.get_running_loop().create_task(self._run(source, after))
+
+    async def _run(self, source, after):
+        error = None
+        try:
+            # ffmpeg starts buffering when spawned, so only the remaining startup time is waited
+            ready_at = getattr(getattr(source, 'source', source), 'ready_at', 0)
+            await asyncio.sleep(max(0, ready_at - time.perf_counter()))
+            start = time.perf_counter()
+            sent = 0
+            first = True
+            while True:
+                if self._paused:
+                    await asyncio.sleep(FRAME_SECONDS)
+                    start = time.perf_counter() - sent * FRAME_SECONDS
+                    continue
+                data = source.read()
+                if not data:
+                    break
+                now = time.perf_counter()
+                if first:
+                    self.first_frame_times.append(now)
+                    first = False
+                self.frames += 1
+                sent += 1
+                delay = start + sent * FRAME_SECONDS - time.perf_counter()
+                await asyncio.sleep(max(0, delay))
+            if not first:
+                self.last_frame_times.append(time.perf_counter())
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            error = e
+        finally:
+            source.cleanup()
+            if after:
+                after(error)
+
+    def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    def pause(self):
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    async def disconnect(self, **kwargs):
+        self.stop()
+        self._connected = False
+        self.guild.voice_client = None
+
+
+class Stubs:
+    """Wires the service modules to the fakes above and restores them on exit"""
+
+    def __init__(self, ydl_latency=0.05, failure_rate=0.0, track_seconds=1.0,
+                 spotify_latency=0.02, spotify_page_latency=0.05, ffmpeg_startup=0.05,
+                 connect_delay=0.05, extraction_rate=None, slow_rate=0.0, slow_latency=2.0):
+        self.settings = dict(
+            ydl_latency=ydl_latency, failure_rate=failure_rate, track_seconds=track_seconds,
+            slow_rate=slow_rate, slow_latency=slow_latency,
+            spotify_latency=spotify_latency, spotify_page_latency=spotify_page_latency,
+            ffmpeg_startup=ffmpeg_startup, connect_delay=connect_delay,
+            extraction_rate=extraction_rate,
+        )
+        self._saved = []
+
+    def _patch(self, obj, name, value):
+        self._saved.append((obj, name, getattr(obj, name)))
+        setattr(obj, name, value)
+
+    def __enter__(self):
+        import discord
+        from services import youtube, spotify
+        from utils.ratelimit import AdaptiveLimiter
+
+        s = self.settings
+        ydl_config.latency = s['ydl_latency']
+        ydl_config.failure_rate = s['failure_rate']
+        ydl_config.slow_rate = s['slow_rate']
+        ydl_config.slow_latency = s['slow_latency']
+        ydl_config.track_seconds = s['track_seconds']
+        ydl_config.calls = 0
+        FakeAudioSource.startup_delay = s['ffmpeg_startup']
+        FakeVoiceClient.connect_delay = s['connect_delay']
+
+        self._patch(youtube, 'youtube_dl', FakeYDLModule)
+        # Unthrottled unless a benchmark is measuring the limiter itself
+        rate = s['extraction_rate']
+        self._patch(youtube, '_limiter', AdaptiveLimiter(rate, max(1, int(rate))) if rate else AdaptiveLimiter(1e9, 10 ** 9))
+        self._patch(spotify, 'sp', FakeSpotify(s['spotify_latency'], s['spotify_page_latency']))
+        self._patch(discord, 'FFmpegPCMAudio', FakeAudioSource)
+        self._patch(discord, 'FFmpegOpusAudio', FakeOpusAudio)
+        return self
+
+    def __exit__(self, *exc):
+        for obj, name, value in reversed(self._saved):
+            setattr(obj, name, value)
+        self._saved.clear()
+        return False
+
+
+class FakeFollowup:
+    def __init__(self, channel):
+        self.channel = channel
+
+    async def send(self, content=None, embed=None, view=None, file=None, wait=False, **kwargs):
+        return await self.channel.send(content, embed=embed, view=view, file=file)
+
+
+class FakeInteraction:
+    """Just enough of discord.Interaction to invoke a slash command callback"""
+    _ids = 0
+
+    def __init__(self, guild, voice_channel, channel, user_id=1):
+        FakeInteraction._ids += 1
+        self.id = FakeInteraction._ids
+        self.guild = guild
+        self.guild_id = guild.id
+        self.channel = channel
+        self.user = type('FakeUser', (), {
+            'id': user_id,
+            'display_name': f'User {user_id}',
+            'display_avatar': type('FakeAsset', (), {'url': 'https://cdn.discordapp.com/embed/avatars/0.png'})(),
+            'voice': type('FakeVoiceState', (), {'channel': voice_channel})(),
+        })()
+        self.response = self
+        self.followup = FakeFollowup(channel)
+
+    async def defer(self, **kwargs):
+        pass
+
+
+def make_interaction(guild_id):
+    """A fake guild that is not yet connected to voice, and an interaction from a user in its voice channel"""
+    guild = FakeGuild(guild_id)
+    channel = FakeTextChannel(guild_id)
+    return guild, FakeInteraction(guild, FakeVoiceChannel(guild), channel)
+
+
+def make_guild(guild_id):
+    """A fake guild with a voice channel, connected voice client and text channel"""
+    guild = FakeGuild(guild_id)
+    voice_channel = FakeVoiceChannel(guild)
+    guild.voice_client = FakeVoiceClient(voice_channel)
+    return guild, guild.voice_client, FakeTextChannel(guild_id)
@@ -0,0 +1,87 @@
+"""Summarize span timings from the JSON-lines trace sink.
+
+    python tools/trace_summary.py data/traces.jsonl --top 10
+"""
+import argparse
+import json
+from collections import defaultdict
+
+
+def _percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def load_spans(path):
+    spans = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                spans.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return spans
+
+
+def summarize(spans):
+    by_stage = defaultdict(list)
+    errors = defaultdict(int)
+    for s in spans:
+        by_stage[s['name']].append(s['ms'])
+        if s.get('error'):
+            errors[s['name']] += 1
+
+    rows = []
+    for name, durations in by_stage.items():
+        ordered = sorted(durations)
+        rows.append({
+            'stage': name,
+            'count': len(ordered),
+            'p50': _percentile(ordered, 0.5),
+            'p95': _percentile(ordered, 0.95),
+            'max': ordered[-1],
+            'total': sum(ordered),
+            'errors': errors[name],
+        })
+    rows.sort(key=lambda r: r['p95'], reverse=True)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('--top', type=int, default=5, help='slowest spans to list per stage')
+    parser.add_argument('--stage', help='only show this stage')
+    args = parser.parse_args()
+
+    spans = load_spans(args.path)
+    if args.stage:
+        spans = [s for s in spans if s['name'] == args.stage]
+    if not spans:
+        print("No spans found")
+        return
+
+    traces = len({s['trace'] for s in spans})
+    print(f"{len(spans)} spans from {traces} traces\n")
+
+    rows = summarize(spans)
+    width = max(len(r['stage']) for r in rows)
+    print(f"{'stage':<{width}} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'errors':>7}")
+    for r in rows:
+        print(f"{r['stage']:<{width}} {r['count']:>7} {r['p50']:>9.1f} {r['p95']:>9.1f} {r['max']:>9.1f} {r['errors']:>7}")
+
+    print(f"\nSlowest spans per stage")
+    for r in rows:
+        slowest = sorted(
+            (s for s in spans if s['name'] == r['stage']), key=lambda s: s['ms'], reverse=True
+        )[:args.top]
+        print(f"\n{r['stage']}")
+        for s in slowest:
+            attrs = ' '.join(f"{k}={v}" for k, v in (s.get('attrs') or {}).items())
+            print(f"  {s['ms']:>9.1f}ms  trace={s['trace']}  {attrs}".rstrip())
+
+
+if __name__ == '__main__':
+    main()